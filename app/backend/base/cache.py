@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_size: int):
+        """
+        In-process cache whose entries expire after ttl seconds, least recently
+        used entries are evicted above max_size. Entries can be tagged, eg. by
+        id of a row, so that all entries of a row are invalidated when the row
+        is updated or deleted.
+
+        Parameters
+        ----------
+        ttl: float
+            Seconds an entry is kept, 0 disables cache
+        max_size: int
+            Maximum number of entries
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        # incremented by each invalidation, see put
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[Hashable], float]]" = (
+            OrderedDict()
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns cached value and marks it as recently used, None if not cached
+        or expired
+
+        Parameters
+        ----------
+        key: Hashable
+
+        Returns
+        -------
+        Any
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        tag: Optional[Hashable] = None,
+        ttl: Optional[float] = None,
+        version: Optional[int] = None,
+    ):
+        """
+        Caches value, least recently used entries are evicted to stay under max_size
+
+        Parameters
+        ----------
+        key: Hashable
+        value: Any
+        tag: Hashable, optional
+            Tag of entry used by invalidate
+        ttl: float, optional
+            Seconds entry is kept if less than ttl of cache, eg. until a token expires
+        version: int, optional
+            version of cache read before value was fetched, value is not cached
+            if cache was invalidated meanwhile since it may be stale
+        """
+        if not self.enabled or (version is not None and version != self.version):
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (value, tag, time.monotonic() + ttl)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, tag: Hashable):
+        """
+        Removes entries with given tag
+
+        Parameters
+        ----------
+        tag: Hashable
+        """
+        self.version += 1
+        for key in [key for key, entry in self._entries.items() if entry[1] == tag]:
+            del self._entries[key]
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        self.version += 1
+        self._entries.clear()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Usage statistics of cache
+
+        Returns
+        -------
+        dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+        }
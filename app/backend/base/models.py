@@ -4,6 +4,7 @@ from loguru import logger
 from sqlalchemy import Table, and_
 
 from ..core.db import database
+from .cache import TTLCache
 from .errors import EntityDoesNotExist
 
 
@@ -13,6 +14,8 @@ def _log_query(query: str, query_params: Union[Dict, List] = None) -> None:
 
 class BaseOps:
     table: Table
+    # cache of rows of table, invalidated by update and delete
+    cache: Optional[TTLCache] = None
 
     def __init__(self):
         self._db = database
@@ -52,10 +55,15 @@ class BaseOps:
         await self._log_and_execute(query)
 
     async def update(self, obj: Dict, condition: Dict):
-        where_clause = {self.table.c[k]: self.table.c[v] for k, v in condition.items()}
-        query = self.table.update().where(and_(**where_clause)).values(**obj)
+        where_clause = [self.table.c[k] == v for k, v in condition.items()]
+        query = self.table.update().where(and_(*where_clause)).values(**obj)
         await self._log_and_execute(query)
+        if self.cache is not None:
+            # updated rows are not known without another query
+            self.cache.clear()
 
     async def delete(self, id: int):
         query = self.table.delete().where(self.table.c.id == id)
         await self._log_and_execute(query)
+        if self.cache is not None:
+            self.cache.invalidate(id)
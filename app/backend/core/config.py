@@ -25,7 +25,34 @@ class BaseConfig:
     JWT_SUBJECT = "access"
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # one week
+    # step logs of sessions are kept in DATA_DIR, workers on several hosts can only
+    # attach to sessions of each other if it is on a shared file system
     DATA_DIR = "data"
+    # kernel pool configuration
+    KERNEL_POOL_MIN_SIZE: int = config("KERNEL_POOL_MIN_SIZE", cast=int, default=1)
+    KERNEL_POOL_MAX_SIZE: int = config("KERNEL_POOL_MAX_SIZE", cast=int, default=4)
+    # seconds a kernel returned to pool has to reset, it is killed and replaced otherwise
+    KERNEL_RESET_TIMEOUT: float = config("KERNEL_RESET_TIMEOUT", cast=float, default=30)
+    # address kernels listen on, 0.0.0.0 lets workers on other hosts attach to them
+    KERNEL_IP: str = config("KERNEL_IP", default="127.0.0.1")
+    # seconds after which running code is interrupted, 0 disables the deadline
+    EXECUTION_TIMEOUT: float = config("EXECUTION_TIMEOUT", cast=float, default=300)
+    WATCHDOG_INTERVAL: float = config("WATCHDOG_INTERVAL", cast=float, default=5)
+    # send single function requests to kuma comm target of kernel instead of executing code
+    KERNEL_RPC: bool = config("KERNEL_RPC", cast=bool, default=True)
+    # seconds a session is kept alive after its last websocket disconnects, 0 disables resume
+    SESSION_IDLE_TTL: float = config("SESSION_IDLE_TTL", cast=float, default=600)
+    # memory used by kernels of a worker above which idle sessions are evicted, 0 disables
+    SESSION_MEMORY_LIMIT: int = config("SESSION_MEMORY_LIMIT", cast=int, default=0)
+    # checkpoint saved variables to parquet so that replay resumes from newest checkpoint
+    CHECKPOINT_STEPS: bool = config("CHECKPOINT_STEPS", cast=bool, default=False)
+    CHECKPOINT_MAX_BYTES: int = config("CHECKPOINT_MAX_BYTES", cast=int, default=2 * 1024 ** 3)
+    # per session cache of read-only request results
+    RESULT_CACHE_MAX_BYTES: int = config("RESULT_CACHE_MAX_BYTES", cast=int, default=32 * 1024 ** 2)
+    # seconds authenticated users are cached by token, 0 disables cache. Cache is per
+    # process, users updated by another worker are seen once their entries expire
+    USER_CACHE_TTL: float = config("USER_CACHE_TTL", cast=float, default=60)
+    USER_CACHE_MAX_SIZE: int = config("USER_CACHE_MAX_SIZE", cast=int, default=1024)
     # logging configuration
     LOGGING_LEVEL = logging.DEBUG if DEBUG else logging.INFO
     logging.basicConfig(handlers=[InterceptHandler(level=LOGGING_LEVEL)], level=LOGGING_LEVEL)
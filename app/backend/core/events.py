@@ -1,5 +1,11 @@
+import asyncio
+import importlib.util
+
 from loguru import logger
 
+from ..pandaui.sessions import session_manager
+from ..services.kuma.catalog import function_catalog, pandas_version
+from ..services.kuma.pool import kernel_pool
 from .db import database
 
 
@@ -11,3 +17,37 @@ async def connect_to_db():
 async def close_db_connection():
     logger.info("Closing db connection..")
     await database.disconnect()
+
+
+async def start_kernel_pool():
+    await kernel_pool.start()
+    logger.info("Kernel pool started.")
+    # kernels run in environment of server
+    if importlib.util.find_spec("pyarrow") is None:
+        logger.warning(
+            "pyarrow is not installed, arrow previews fall back to json, checkpoints are "
+            "disabled and chunked requests can't write Parquet files."
+        )
+
+
+async def close_kernel_pool():
+    logger.info("Shutting down kernel pool..")
+    await kernel_pool.close()
+
+
+async def start_sessions():
+    session_manager.start()
+    logger.info("Session manager started.")
+
+
+async def close_sessions():
+    logger.info("Closing sessions..")
+    await session_manager.close_all()
+
+
+async def load_function_catalog():
+    if function_catalog.load():
+        logger.info("Function catalog loaded.")
+        return
+    logger.warning(f"Function catalog for pandas {pandas_version()} not found, building it..")
+    asyncio.ensure_future(function_catalog.rebuild())
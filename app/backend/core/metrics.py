@@ -0,0 +1,211 @@
+"""
+Minimal registry of counters and histograms exposed in Prometheus text format
+on /metrics route
+"""
+from typing import Dict, List, Sequence, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# upper bounds of buckets of durations in seconds
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# upper bounds of buckets of sizes in bytes, 1MiB to 16GiB
+BYTES_BUCKETS = tuple(2 ** power for power in range(20, 36, 2))
+
+router = APIRouter()
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = [
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """
+        Base class of metrics, each metric has a value per combination of labels
+
+        Parameters
+        ----------
+        name: str
+            Name of metric, eg. kuma_requests_total
+        documentation: str
+            Help text of metric
+        labels: list of str, default ()
+            Names of labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        metrics_registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Labels of {self.name} should be {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Renders metric in Prometheus text format
+
+        Returns
+        -------
+        str
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        # samples of a counter are named after it, their name ends with _total
+        if not name.endswith("_total"):
+            raise ValueError(f"Name of counter {name} should end with _total")
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        """
+        Increments counter of given labels
+
+        Parameters
+        ----------
+        amount: float, default 1
+        labels: str
+            Value of each label of metric
+        """
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(list(zip(self.labels, key)))} " f"{_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ):
+        """
+        Counts observed values in buckets of cumulative upper bounds
+
+        Parameters
+        ----------
+        name: str
+        documentation: str
+        labels: list of str, default ()
+        buckets: list of float, default SECONDS_BUCKETS
+            Sorted upper bounds of buckets, +Inf is added
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # count of each bucket, sum and count of observed values per labels
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        Observes a value for given labels
+
+        Parameters
+        ----------
+        value: float
+        labels: str
+            Value of each label of metric
+        """
+        key = self._key(labels)
+        counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[position] += 1
+                break
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        samples = []
+        for key, (counts, total) in self._values.items():
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(pairs + [("le", _format_value(bound))])
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total[0])}")
+            samples.append(f"{self.name}_count{_format_labels(pairs)} {cumulative}")
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Metrics of the process, rendered together on /metrics route
+        """
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        Renders all metrics in Prometheus text format
+
+        Returns
+        -------
+        str
+        """
+        return "".join(f"{metric.render()}\n" for metric in self.metrics.values())
+
+
+metrics_registry = MetricsRegistry()
+
+requests_total = Counter(
+    "kuma_requests_total", "Requests handled by pandaui websocket", ["type", "status"]
+)
+phase_seconds = Histogram(
+    "kuma_request_phase_seconds",
+    "Seconds taken by each phase of a request, i.e. codegen, queue, execute, render and send",
+    ["phase"],
+)
+kernel_rss_bytes = Histogram(
+    "kuma_kernel_rss_bytes",
+    "Resident memory of kernel sampled after each saved step",
+    buckets=BYTES_BUCKETS,
+)
+frame_memory_bytes = Histogram(
+    "kuma_frame_memory_bytes",
+    "Deep memory usage of result of each saved step",
+    buckets=BYTES_BUCKETS,
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
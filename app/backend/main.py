@@ -6,7 +6,16 @@ from app.backend.base.errors import http422_error_handler, http_error_handler
 from app.backend.core.config import app_config
 
 from .api import router as api_router
-from .core.events import close_db_connection, connect_to_db
+from .core.metrics import router as metrics_router
+from .core.events import (
+    close_db_connection,
+    close_kernel_pool,
+    close_sessions,
+    connect_to_db,
+    load_function_catalog,
+    start_kernel_pool,
+    start_sessions,
+)
 
 
 def get_application() -> FastAPI:
@@ -25,15 +34,21 @@ def get_application() -> FastAPI:
     @application.on_event("startup")
     async def startup_event():
         await connect_to_db()
+        await start_kernel_pool()
+        await start_sessions()
+        await load_function_catalog()
 
     @application.on_event("shutdown")
     async def shutdown_event():
+        await close_sessions()
+        await close_kernel_pool()
         await close_db_connection()
 
     application.add_exception_handler(HTTPException, http_error_handler)
     application.add_exception_handler(RequestValidationError, http422_error_handler)
 
     application.include_router(api_router, prefix=app_config.API_PREFIX)
+    application.include_router(metrics_router)
 
     return application
 
@@ -10,6 +10,7 @@ sys.path.append(str(pathlib.Path(__file__).resolve().parents[3]))
 from app.backend.core.config import app_config  # isort:skip
 from app.backend.core.db import metadata  # isort:skip
 from app.backend.user.models import user  # isort:skip
+from app.backend.pandaui.models import kuma_session  # isort:skip
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
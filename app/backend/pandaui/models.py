@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Dict, List
+
+import sqlalchemy
+
+from ..base.errors import EntityDoesNotExist
+from ..base.models import BaseOps
+from ..core.db import metadata
+from .schema import SessionInDB
+
+kuma_session = sqlalchemy.Table(
+    "kuma_session",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String(32), primary_key=True),
+    sqlalchemy.Column("worker", sqlalchemy.String(128), index=True, nullable=False),
+    sqlalchemy.Column("connection_info", sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column("last_activity", sqlalchemy.DateTime, nullable=False),
+)
+
+
+class SessionOps(BaseOps):
+    table = kuma_session
+
+    async def get_session(self, session_id: str) -> SessionInDB:
+        query = self.table.select().where(self.table.c.id == session_id)
+        session = await self._log_and_fetch_row(query)
+        if session:
+            return SessionInDB.from_orm(session)
+        raise EntityDoesNotExist(f"Session with id:{session_id} not found!")
+
+    async def get_worker_sessions(self, worker: str) -> List[SessionInDB]:
+        query = self.table.select().where(self.table.c.worker == worker)
+        return [SessionInDB.from_orm(session) for session in await self._log_and_fetch(query)]
+
+    async def register(self, session_id: str, worker: str, connection_info: Dict):
+        session = SessionInDB(
+            id=session_id,
+            worker=worker,
+            connection_info=connection_info,
+            last_activity=datetime.utcnow(),
+        )
+        await self.delete(session_id)
+        await self.insert(session.dict(by_alias=True))
+
+    async def touch(self, session_id: str):
+        query = (
+            self.table.update()
+            .where(self.table.c.id == session_id)
+            .values(last_activity=datetime.utcnow())
+        )
+        await self._log_and_execute(query)
+
+    async def delete_worker_sessions(self, worker: str):
+        query = self.table.delete().where(self.table.c.worker == worker)
+        await self._log_and_execute(query)
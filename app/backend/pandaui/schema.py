@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Any, Dict
+
+import orjson
+from pydantic import BaseModel, Field, validator
+
+
+class SessionInDB(BaseModel):
+    id_: str = Field(..., alias="id")
+    worker: str
+    connection_info: Dict[str, Any]
+    last_activity: datetime
+
+    @validator("connection_info", pre=True)
+    def load_connection_info(cls, value: Any) -> Dict[str, Any]:  # noqa: N805
+        return orjson.loads(value) if isinstance(value, (str, bytes)) else value
+
+    def dict(self, **kwargs: Any) -> Dict[str, Any]:  # type: ignore
+        data = super().dict(**kwargs)
+        data["connection_info"] = orjson.dumps(data["connection_info"]).decode()
+        return data
+
+    class Config:
+        orm_mode = True
+        allow_population_by_field_name = True
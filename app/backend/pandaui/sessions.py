@@ -0,0 +1,406 @@
+import asyncio
+import os
+import re
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from fastapi import WebSocket
+from loguru import logger
+
+from app.backend.base.errors import EntityDoesNotExist
+from app.backend.core.config import app_config
+from app.backend.pandaui.models import SessionOps
+from app.backend.services.kuma.cache import ResultCache
+from app.backend.services.kuma.executor import JupyterExecutor
+from app.backend.services.kuma.main import KumaSession
+from app.backend.services.kuma.pool import kernel_pool
+from app.backend.services.kuma.watchdog import KernelWatchdog
+
+# identifies this worker process in session registry
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# minimum seconds between two updates of last activity of a session in registry
+TOUCH_INTERVAL = 30
+# maximum seconds between two checks for expired idle sessions
+REAP_INTERVAL = 30
+# session ids are used in file names of session logs
+SESSION_ID_PATTERN = re.compile(r"[0-9A-Za-z_-]{1,32}")
+
+
+def notebook_path(session_id: str) -> str:
+    """
+    Path of notebook exported from steps of a session
+
+    Parameters
+    ----------
+    session_id: str
+
+    Returns
+    -------
+    str
+    """
+    return f"{app_config.DATA_DIR}/sessions/{session_id}.ipynb"
+
+
+class SessionEntry:
+    def __init__(
+        self,
+        session_id: str,
+        session: KumaSession,
+        executor: JupyterExecutor,
+        watchdog: Optional[KernelWatchdog] = None,
+    ):
+        """
+        A session opened in this worker, either owning its kernel or attached
+        to a kernel owned by another worker
+
+        Parameters
+        ----------
+        session_id: str
+        session: KumaSession
+        executor: JupyterExecutor
+        watchdog: KernelWatchdog, default None
+            Watchdog of kernel, only the owning worker watches a kernel
+        """
+        self.id = session_id
+        self.session = session
+        self.executor = executor
+        self.watchdog = watchdog
+        self.websockets: List[WebSocket] = []
+        self.last_activity = datetime.utcnow()
+        # last activity written to registry
+        self.touched = datetime.min
+
+    @property
+    def owner(self) -> bool:
+        return self.executor.owner
+
+    @property
+    def idle(self) -> bool:
+        return not self.websockets
+
+    async def broadcast(self, message: Dict[str, Any]):
+        """
+        Sends a json message to every websocket connected to the session
+        """
+        for websocket in list(self.websockets):
+            await websocket.send_json(message)
+
+
+class SessionManager:
+    def __init__(
+        self,
+        worker: str = WORKER_ID,
+        idle_ttl: float = app_config.SESSION_IDLE_TTL,
+        memory_limit: int = app_config.SESSION_MEMORY_LIMIT,
+    ):
+        """
+        Keeps sessions opened in this worker and their registration in the
+        shared session registry, so that a websocket landing on any worker can
+        attach to the kernel of its session using kernel connection info.
+
+        Sessions owned by this worker outlive their websockets for idle_ttl
+        seconds so that clients can resume them after reconnecting. When
+        kernels of this worker use more than memory_limit bytes, idle sessions
+        are evicted least recently used first.
+
+        Parameters
+        ----------
+        worker: str, default WORKER_ID
+            Id of this worker in session registry
+        idle_ttl: float, default SESSION_IDLE_TTL from config
+            Seconds an idle session is kept alive, 0 closes it on disconnect
+        memory_limit: int, default SESSION_MEMORY_LIMIT from config
+            Total kernel memory above which idle sessions are evicted, 0 disables
+        """
+        self.worker = worker
+        self.idle_ttl = idle_ttl
+        self.memory_limit = memory_limit
+        self.evicted = 0
+        self._reaper: Optional[asyncio.Future] = None
+        self.registry = SessionOps()
+        self._entries: Dict[str, SessionEntry] = {}
+        # sessions are opened and closed under a lock per session id, so that
+        # concurrent websockets of a session share a single kernel. Lock is kept
+        # along with number of its users until none is left.
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def start(self):
+        """
+        Starts evicting expired idle sessions in background
+        """
+        if self.idle_ttl and (self._reaper is None or self._reaper.done()):
+            self._reaper = asyncio.ensure_future(self._reap_forever())
+
+    async def stop(self):
+        """
+        Stops evicting idle sessions
+        """
+        if self._reaper and not self._reaper.done():
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+
+    async def open(
+        self, session_id: Optional[str], websocket: WebSocket
+    ) -> Tuple[SessionEntry, bool]:
+        """
+        Opens session for a websocket, a session already open in this worker is
+        resumed, a session registered by another worker is attached to and a new
+        session is created otherwise
+
+        Parameters
+        ----------
+        session_id: str
+            Id of session requested by client, a new id is generated if None
+        websocket: WebSocket
+
+        Returns
+        -------
+        Tuple of SessionEntry and bool, whether or not an existing session was
+        resumed or restored from its step log
+        """
+        if session_id and not SESSION_ID_PATTERN.fullmatch(session_id):
+            logger.warning(f"Ignoring invalid session id {session_id!r}")
+            session_id = None
+        session_id = session_id or uuid4().hex
+        created = False
+        async with self._lock(session_id):
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = await self._attach(session_id)
+                if entry is None:
+                    entry = await self._create(session_id)
+                    created = True
+                self._entries[session_id] = entry
+            entry.websockets.append(websocket)
+        await self.touch(entry)
+        if created:
+            await self.evict()
+        return entry, not created or len(entry.session.store) > 0
+
+    @asynccontextmanager
+    async def _lock(self, session_id: str) -> AsyncIterator[None]:
+        lock, users = self._locks.get(session_id, (asyncio.Lock(), 0))
+        self._locks[session_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[session_id]
+            if users == 1:
+                del self._locks[session_id]
+            else:
+                self._locks[session_id] = (lock, users - 1)
+
+    async def _attach(self, session_id: str) -> Optional[SessionEntry]:
+        try:
+            registered = await self.registry.get_session(session_id)
+        except EntityDoesNotExist:
+            return None
+        if registered.worker != self.worker and not os.path.exists(
+            KumaSession.log_path(session_id)
+        ):
+            logger.warning(
+                f"Step log of session {session_id} owned by {registered.worker} not found, "
+                "DATA_DIR has to be shared by workers attaching to sessions, starting a new one"
+            )
+        elif registered.worker != self.worker:
+            try:
+                executor = await JupyterExecutor.attach(registered.connection_info)
+            except Exception:
+                logger.opt(exception=True).warning(
+                    f"Unable to attach to kernel of session {session_id} "
+                    f"owned by {registered.worker}, starting a new one"
+                )
+            else:
+                logger.info(f"Attached to session {session_id} owned by {registered.worker}")
+                # steps are appended to log of owning worker, so that they are
+                # replayed, exported and resumed by it
+                session = KumaSession(session_id, attached=True)
+                # requests mutating state through the owning worker can't invalidate
+                # results cached here
+                session.results = ResultCache(0)
+                return SessionEntry(session_id, session, executor)
+        await self.registry.delete(session_id)
+        return None
+
+    async def _create(self, session_id: str) -> SessionEntry:
+        session = KumaSession(session_id)
+        executor = await kernel_pool.acquire()
+        if len(session.store):
+            # step log left behind by a worker which crashed
+            logger.info(f"Restoring {len(session.store)} steps of session {session_id}")
+            await executor.execute(session.replay_code())
+        watchdog = KernelWatchdog(executor, session, app_config.WATCHDOG_INTERVAL)
+        entry = SessionEntry(session_id, session, executor, watchdog)
+
+        async def on_recover():
+            # restarted kernel runs in a new process
+            await self.registry.register(session_id, self.worker, executor.connection_info)
+            await entry.broadcast({"type": "restarted"})
+
+        watchdog.on_recover = on_recover
+        watchdog.start()
+        await self.registry.register(session_id, self.worker, executor.connection_info)
+        logger.info(f"Session {session_id} created")
+        return entry
+
+    async def touch(self, entry: SessionEntry):
+        """
+        Updates last activity of session in registry, at most once per TOUCH_INTERVAL
+
+        Parameters
+        ----------
+        entry: SessionEntry
+        """
+        entry.last_activity = datetime.utcnow()
+        if entry.last_activity - entry.touched < timedelta(seconds=TOUCH_INTERVAL):
+            return
+        entry.touched = entry.last_activity
+        try:
+            await self.registry.touch(entry.id)
+        except Exception:
+            logger.opt(exception=True).warning(f"Unable to update activity of {entry.id}")
+
+    async def disconnect(self, entry: SessionEntry, websocket: WebSocket):
+        """
+        Removes websocket from its session, an owned session without websockets
+        is kept alive for idle_ttl seconds, an attached one is closed right away
+
+        Parameters
+        ----------
+        entry: SessionEntry
+        websocket: WebSocket
+        """
+        if websocket in entry.websockets:
+            entry.websockets.remove(websocket)
+        if not entry.idle:
+            return
+        entry.last_activity = datetime.utcnow()
+        if entry.owner and self.idle_ttl:
+            logger.info(f"Session {entry.id} is idle, keeping it for {self.idle_ttl} seconds")
+            return
+        await self._close_idle(entry)
+
+    async def _last_activity(self, entry: SessionEntry) -> datetime:
+        # websockets attached through other workers update registry only
+        try:
+            registered = await self.registry.get_session(entry.id)
+        except EntityDoesNotExist:
+            return entry.last_activity
+        return max(entry.last_activity, registered.last_activity)
+
+    async def reap(self):
+        """
+        Closes idle sessions which expired, i.e. had no activity through any
+        worker for idle_ttl seconds
+        """
+        expiry = datetime.utcnow() - timedelta(seconds=self.idle_ttl)
+        for entry in list(self._entries.values()):
+            if entry.owner and entry.idle and await self._last_activity(entry) < expiry:
+                logger.info(f"Session {entry.id} expired")
+                await self._close_idle(entry)
+        await self.evict()
+
+    async def evict(self):
+        """
+        Closes idle sessions, least recently used first, while kernels owned by
+        this worker use more than memory_limit bytes
+        """
+        if not self.memory_limit:
+            return
+        owned = [entry for entry in self._entries.values() if entry.owner]
+        usage = {entry.id: entry.executor.memory() for entry in owned}
+        total = sum(usage.values())
+        if total <= self.memory_limit:
+            return
+        idle = [(await self._last_activity(entry), entry) for entry in owned if entry.idle]
+        for _, entry in sorted(idle, key=lambda item: item[0]):
+            if total <= self.memory_limit:
+                break
+            logger.warning(
+                f"Kernels use {total} bytes, evicting idle session {entry.id} "
+                f"using {usage[entry.id]} bytes"
+            )
+            if await self._close_idle(entry):
+                total -= usage[entry.id]
+                self.evicted += 1
+
+    async def _close_idle(self, entry: SessionEntry) -> bool:
+        # a websocket could be resuming the session while it is being closed, it
+        # waits for the session to be torn down before opening it again
+        async with self._lock(entry.id):
+            if not entry.idle:
+                return False
+            await self.close(entry)
+            return True
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(min(REAP_INTERVAL, self.idle_ttl))
+            try:
+                await self.reap()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.opt(exception=True).error("Unable to evict idle sessions")
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Number of open, idle and evicted sessions of this worker
+
+        Returns
+        -------
+        dict
+        """
+        entries = list(self._entries.values())
+        return {
+            "worker": self.worker,
+            "open": len(entries),
+            "owned": sum(entry.owner for entry in entries),
+            "idle": sum(entry.idle for entry in entries),
+            "evicted": self.evicted,
+        }
+
+    async def close(self, entry: SessionEntry):
+        """
+        Closes a session regardless of its websockets. Owned kernel is returned
+        to pool and session is removed from registry, an attached kernel is only
+        disconnected.
+
+        Parameters
+        ----------
+        entry: SessionEntry
+        """
+        if self._entries.get(entry.id) is not entry:
+            return
+        del self._entries[entry.id]
+        logger.info(f"Result cache stats: {entry.session.results.stats}")
+        if not entry.owner:
+            await entry.executor.shutdown()
+            await entry.session.close()
+            return
+        await entry.watchdog.stop()
+        await self.registry.delete(entry.id)
+        logger.info("Returning Kernel to pool")
+        await kernel_pool.release(entry.executor)
+        await entry.session.close(notebook_path(entry.id))
+
+    async def close_all(self):
+        """
+        Closes every session of this worker, kernels owned by this worker die
+        with it so its registrations are removed
+        """
+        await self.stop()
+        for entry in list(self._entries.values()):
+            await self.close(entry)
+        await self.registry.delete_worker_sessions(self.worker)
+
+
+session_manager = SessionManager()
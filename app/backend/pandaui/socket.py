@@ -1,11 +1,37 @@
-from fastapi import APIRouter, WebSocket
-from fastapi.responses import HTMLResponse
+import asyncio
+import base64
+from time import perf_counter
+from typing import Any, Dict, Optional, Set
+from uuid import uuid4
+
+import orjson
+from fastapi import APIRouter, Request, WebSocket, status
+from fastapi.responses import HTMLResponse, Response
 from loguru import logger
 from starlette.websockets import WebSocketDisconnect
 
 from app.backend.core.config import app_config
+from app.backend.core.metrics import (
+    frame_memory_bytes,
+    kernel_rss_bytes,
+    phase_seconds,
+    requests_total,
+)
+from app.backend.pandaui.sessions import notebook_path, session_manager
+from app.backend.services.kuma.cache import ResultCache
+from app.backend.services.kuma.catalog import function_catalog
+from app.backend.services.kuma.code_generator import (
+    ARROW_MIME_TYPE,
+    DTYPES_MIME_TYPE,
+    JSON_MIME_TYPE,
+    METRICS_MIME_TYPE,
+    PROGRESS_MIME_TYPE,
+    SCHEMA_MIME_TYPE,
+    TIMINGS_MIME_TYPE,
+)
+from app.backend.services.kuma.executor import Execution, JupyterExecutor
 from app.backend.services.kuma.main import KumaSession
-from app.backend.services.kuma.executor import JupyterExecutor
+from app.backend.services.kuma.pool import kernel_pool
 
 router = APIRouter()
 
@@ -24,16 +50,26 @@ html = """
             <input type="text" id="funcText" autocomplete="on" placeholder="Function"/>
             <input type="text" id="argText" autocomplete="on" placeholder="args"/>
             <input type="checkbox" id="save" name="save" value="save">
+            <input type="checkbox" id="stream" name="stream" value="stream">
             <button>Send</button>
         </form>
         <div id='messages'>
         </div>
         <script>
-            var ws = new WebSocket("ws://localhost:8000/api/pandaui/ws");
+            var session = sessionStorage.getItem("kumaSession") || ""
+            var ws = new WebSocket("ws://localhost:8000/api/pandaui/ws?session=" + session);
             ws.onmessage = function(event) {
                 var messages = document.getElementById('messages')
                 var message = document.createElement('div')
-                message.innerHTML += event.data
+                var data = event.data
+                if (data.startsWith('{"id"')) {
+                    var frame = JSON.parse(data)
+                    if (frame.type == "session") return sessionStorage.setItem("kumaSession", frame.id)
+                    if (frame.type == "progress") return console.log(frame.loaded + "/" + frame.total)
+                    if (frame.data === undefined) return
+                    data = typeof frame.data == "string" ? frame.data : frame.data["text/plain"]
+                }
+                message.innerHTML += data
                 messages.appendChild(message)
             };
             function sendMessage(event) {
@@ -42,7 +78,8 @@ html = """
                 var arg = document.getElementById("argText")
                 var kwargs = document.getElementById("kwargText")
                 var save = document.getElementById("save")
-                var obj = {"func" : func.value, "mod": mod.value, "args": [arg.value], "save": save.checked}
+                var stream = document.getElementById("stream")
+                var obj = {"func" : func.value, "mod": mod.value, "args": [arg.value], "save": save.checked, "stream": stream.checked}
                 ws.send(JSON.stringify(obj))
                 event.preventDefault()
             }
@@ -57,21 +94,301 @@ async def get():
     return HTMLResponse(html)
 
 
+@router.get("/functions")
+async def functions(request: Request):
+    if not function_catalog.loaded:
+        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    headers = {"ETag": function_catalog.etag, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == function_catalog.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        content = function_catalog.compressed
+    else:
+        content = function_catalog.content
+    return Response(content, media_type="application/json", headers=headers)
+
+
+@router.get("/pool")
+async def pool_stats():
+    return kernel_pool.stats
+
+
+@router.get("/sessions")
+async def session_stats():
+    return session_manager.stats
+
+
+@router.get("/cache")
+async def cache_stats():
+    totals = ResultCache.totals
+    lookups = totals["hits"] + totals["misses"]
+    return {**totals, "hit_rate": totals["hits"] / lookups if lookups else 0.0}
+
+
+async def send_result(websocket: WebSocket, result: Any):
+    """
+    Sends result of execution to websocket, arrow payload is sent as a binary
+    frame and columnar json is relayed as it is
+    """
+    if isinstance(result, dict) and ARROW_MIME_TYPE in result:
+        await websocket.send_bytes(base64.b64decode(result[ARROW_MIME_TYPE]))
+    elif isinstance(result, dict) and JSON_MIME_TYPE in result:
+        await websocket.send_text(result[JSON_MIME_TYPE])
+    else:
+        await websocket.send_text(f"{result}")
+
+
+async def stream_result(
+    websocket: WebSocket,
+    executor: JupyterExecutor,
+    execution: Execution,
+    request_id: str,
+    timeout: Optional[float] = None,
+    request: Optional[Dict[str, Any]] = None,
+):
+    """
+    Forwards output of execution to websocket as soon as kernel produces it, each
+    frame is tagged with request id and a completion frame is sent at the end,
+    after timings of operations if request is a batch
+    """
+    async for output in executor.stream(execution, timeout):
+        data = output["data"]
+        if isinstance(data, dict) and ARROW_MIME_TYPE in data:
+            await websocket.send_json(
+                {"id": request_id, "type": output["type"], "mime": ARROW_MIME_TYPE, "binary": True}
+            )
+            await websocket.send_bytes(base64.b64decode(data[ARROW_MIME_TYPE]))
+        else:
+            await websocket.send_json({"id": request_id, **output})
+    if request and request.get("type") == "batch" and not request.get("chunked"):
+        await send_timings(websocket, execution, request, request_id)
+    await websocket.send_json({"id": request_id, "type": "complete", "status": execution.status})
+
+
+async def send_timings(
+    websocket: WebSocket, execution: Execution, data: Dict[str, Any], request_id: str
+):
+    """
+    Sends seconds taken by each operation of a batch request, operations after
+    a failed one have no timing
+    """
+    timings = orjson.loads(execution.displays.get(TIMINGS_MIME_TYPE, "[]"))
+    steps = [
+        {"func": step.get("func"), "seconds": seconds}
+        for step, seconds in zip(data["steps"], timings)
+    ]
+    await websocket.send_json(
+        {"id": request_id, "type": "timings", "status": execution.status, "steps": steps}
+    )
+
+
+async def send_dtypes_report(websocket: WebSocket, execution: Execution, request_id: str):
+    """
+    Sends dtypes and bytes of each column before and after dtypes of result
+    were optimized, nothing is sent if they were not optimized
+    """
+    report = execution.displays.get(DTYPES_MIME_TYPE)
+    if report is not None:
+        await websocket.send_json({"id": request_id, "type": "dtypes", **orjson.loads(report)})
+
+
+async def load_with_preview(
+    websocket: WebSocket,
+    executor: JupyterExecutor,
+    preview: Execution,
+    execution: Execution,
+    request_id: str,
+    timeout: Optional[float] = None,
+):
+    """
+    Sends preview of a read_csv request and its sampled schema as soon as they
+    are ready, followed by progress of loading the whole file, its result and
+    a ready frame once variable is assigned in kernel
+    """
+    result = await executor.wait(preview, timeout)
+    schema = orjson.loads(preview.displays.get(SCHEMA_MIME_TYPE, "[]"))
+    await websocket.send_json(
+        {"id": request_id, "type": "preview", "status": preview.status, "schema": schema}
+    )
+    if preview.status == "ok":
+        await send_result(websocket, result)
+    async for output in executor.stream(execution, timeout):
+        data = output["data"]
+        if isinstance(data, dict) and PROGRESS_MIME_TYPE in data:
+            progress = orjson.loads(data[PROGRESS_MIME_TYPE])
+            await websocket.send_json({"id": request_id, "type": "progress", **progress})
+    if execution.status == "ok":
+        await send_result(websocket, execution.result)
+        await send_dtypes_report(websocket, execution, request_id)
+    await websocket.send_json({"id": request_id, "type": "ready", "status": execution.status})
+
+
+def record_metrics(
+    session: KumaSession,
+    execution: Execution,
+    data: Dict[str, Any],
+    phases: Dict[str, float],
+    step: Optional[int] = None,
+):
+    """
+    Observes seconds taken by each phase of a request along with memory sampled
+    by kernel, figures of a saved step are stored along with it
+    """
+    kernel = orjson.loads(execution.displays.get(METRICS_MIME_TYPE, "{}"))
+    if execution.started_at is not None and execution.finished_at is not None:
+        render = kernel.get("render", 0.0)
+        phases["queue"] = execution.started_at - execution.submitted_at
+        phases["execute"] = max(execution.finished_at - execution.started_at - render, 0.0)
+        if "render" in kernel:
+            phases["render"] = render
+    requests_total.inc(type=data.get("type", "function"), status=execution.status)
+    for phase, seconds in phases.items():
+        phase_seconds.observe(seconds, phase=phase)
+    memory = {key: kernel[key] for key in ("kernel_rss", "memory_usage") if key in kernel}
+    if "kernel_rss" in memory:
+        kernel_rss_bytes.observe(memory["kernel_rss"])
+    if "memory_usage" in memory:
+        frame_memory_bytes.observe(memory["memory_usage"])
+    if step is not None and execution.status == "ok":
+        session.record_metrics(step, {"phases": phases, **memory})
+
+
+async def handle_request(
+    websocket: WebSocket,
+    session: KumaSession,
+    executor: JupyterExecutor,
+    data: Dict[str, Any],
+    executions: Dict[str, Execution],
+    output_format: str = "html",
+):
+    request_id = data.get("id") or uuid4().hex
+    output_format = data.get("format", output_format)
+    timeout = data.get("timeout", app_config.EXECUTION_TIMEOUT) or None
+    cache_key = None
+    preview_code = None
+    operation = None
+    step = None
+    started = perf_counter()
+    try:
+        if data.get("type") == "view":
+            code = session.view(data, display_rows=10, output_format=output_format)
+        else:
+            save = data["save"]
+            if data.get("preview"):
+                preview_code = session.preview(data, display_rows=10, output_format=output_format)
+            elif not save and not data.get("stream"):
+                cache_key = session.result_key(data, display_rows=10, output_format=output_format)
+                cached = session.cached_result(cache_key, data) if cache_key else None
+                if cached is not None:
+                    requests_total.inc(type=data.get("type", "function"), status="cached")
+                    await send_result(websocket, cached)
+                    return
+            checkpoint = data.get("checkpoint", app_config.CHECKPOINT_STEPS)
+            if (
+                preview_code is None
+                and not data.get("stream")
+                and data.get("rpc", app_config.KERNEL_RPC)
+            ):
+                operation = session.call(
+                    data,
+                    save=save,
+                    display_rows=10,
+                    output_format=output_format,
+                    checkpoint=checkpoint,
+                )
+            if operation is None:
+                code = session.code(
+                    data,
+                    save=save,
+                    display_rows=10,
+                    output_format=output_format,
+                    checkpoint=checkpoint,
+                    progress=preview_code is not None,
+                )
+            step = session.last_step if save else None
+    except (KeyError, ValueError) as error:
+        requests_total.inc(type=data.get("type", "function"), status="invalid")
+        await websocket.send_json({"id": request_id, "type": "error", "error": str(error)})
+        return
+    phases = {"codegen": perf_counter() - started}
+    preview = executor.submit(preview_code) if preview_code else None
+    if operation is not None:
+        execution = executor.call(operation)
+    else:
+        execution = executor.submit(code, stream=bool(data.get("stream") or preview))
+    executions[request_id] = execution
+    try:
+        if preview:
+            await load_with_preview(websocket, executor, preview, execution, request_id, timeout)
+        elif data.get("stream"):
+            await stream_result(websocket, executor, execution, request_id, timeout, data)
+        else:
+            result = await executor.wait(execution, timeout)
+            sending = perf_counter()
+            if execution.outcome:
+                await websocket.send_json(
+                    {"id": request_id, "type": "error", "status": execution.status}
+                )
+            elif execution.error and (data.get("type") != "batch" or data.get("chunked")):
+                await websocket.send_json(
+                    {
+                        "id": request_id,
+                        "type": "error",
+                        "status": execution.status,
+                        "ename": execution.error.get("ename"),
+                        "evalue": execution.error.get("evalue"),
+                    }
+                )
+            elif data.get("type") != "batch" or data.get("chunked"):
+                if cache_key and execution.status == "ok":
+                    session.cache_result(cache_key, result)
+                await send_result(websocket, result)
+                await send_dtypes_report(websocket, execution, request_id)
+            else:
+                if execution.status == "ok":
+                    await send_result(websocket, result)
+                    await send_dtypes_report(websocket, execution, request_id)
+                await send_timings(websocket, execution, data, request_id)
+            phases["send"] = perf_counter() - sending
+        record_metrics(session, execution, data, phases, step)
+    finally:
+        executions.pop(request_id, None)
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    session = KumaSession()
-    executor = await JupyterExecutor.new()
+    output_format = websocket.query_params.get("format", "html")
+    entry, resumed = await session_manager.open(websocket.query_params.get("session"), websocket)
+    session, executor = entry.session, entry.executor
+    await websocket.send_json({"id": entry.id, "type": "session", "resumed": resumed})
+    executions: Dict[str, Execution] = {}
+    requests: Set[asyncio.Future] = set()
     try:
         while True:
             data = await websocket.receive_json()
-            save = data["save"]
-            code = session.code(data, save=save, display_rows=10)
-            result = await executor.execute(code)
-            await websocket.send_text(f"{result}")
+            await session_manager.touch(entry)
+            if data.get("type") == "cancel":
+                execution = executions.get(data.get("id"))
+                if execution:
+                    await executor.cancel(execution)
+                continue
+            if data.get("type") == "export":
+                path = notebook_path(entry.id)
+                await session.export(path)
+                await websocket.send_json({"id": data.get("id"), "type": "exported", "path": path})
+                continue
+            # code is generated and submitted before the first await of handle_request,
+            # so requests reach the kernel in the order they were received
+            request = asyncio.ensure_future(
+                handle_request(websocket, session, executor, data, executions, output_format)
+            )
+            requests.add(request)
+            request.add_done_callback(requests.discard)
     except WebSocketDisconnect:
         logger.info("Client disconnected")
     finally:
-        logger.info("Shutting down Kernel")
-        await executor.shutdown()
-        session.save(f"{app_config.DATA_DIR}/untitled.ipynb")
+        for request in requests:
+            request.cancel()
+        await session_manager.disconnect(entry, websocket)
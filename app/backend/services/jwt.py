@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Tuple
 
 import jwt
 from pydantic import EmailStr, ValidationError
@@ -26,8 +26,13 @@ def create_access_token_for_user(user: User, secret_key: str) -> str:
 
 
 def get_email_from_token(token: str, secret_key: str) -> EmailStr:
+    return get_email_and_expiry_from_token(token, secret_key)[0]
+
+
+def get_email_and_expiry_from_token(token: str, secret_key: str) -> Tuple[EmailStr, datetime]:
     try:
-        return User(**jwt.decode(token, secret_key, algorithms=[app_config.ALGORITHM])).email
+        payload = jwt.decode(token, secret_key, algorithms=[app_config.ALGORITHM])
+        return User(**payload).email, JWTMeta(**payload).exp
     except jwt.PyJWTError as decode_error:
         raise ValueError("unable to decode JWT token") from decode_error
     except ValidationError as validation_error:
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResultCache:
+    totals: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def __init__(self, max_bytes: int):
+        """
+        Least recently used cache of execution results bounded by their size
+
+        Parameters
+        ----------
+        max_bytes: int
+            Maximum total size of cached results, results larger than this are not cached
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._results: "OrderedDict[str, Any]" = OrderedDict()
+
+    @staticmethod
+    def sizeof(result: Any) -> int:
+        """
+        Approximate size of a result, results are str or dict of str
+
+        Parameters
+        ----------
+        result: Any
+
+        Returns
+        -------
+        int
+        """
+        if isinstance(result, dict):
+            return sum(len(key) + len(str(value)) for key, value in result.items())
+        return len(str(result))
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns cached result and marks it as recently used, None if not cached
+
+        Parameters
+        ----------
+        key: str
+
+        Returns
+        -------
+        Any
+        """
+        if key not in self._results:
+            self.misses += 1
+            ResultCache.totals["misses"] += 1
+            return None
+        self.hits += 1
+        ResultCache.totals["hits"] += 1
+        self._results.move_to_end(key)
+        return self._results[key]
+
+    def put(self, key: str, result: Any):
+        """
+        Caches result, least recently used results are evicted to stay under max_bytes
+
+        Parameters
+        ----------
+        key: str
+        result: Any
+        """
+        size = self.sizeof(result)
+        if size > self.max_bytes:
+            return
+        if key in self._results:
+            self.size -= self.sizeof(self._results.pop(key))
+        self._results[key] = result
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._results.popitem(last=False)
+            self.size -= self.sizeof(evicted)
+
+    def clear(self):
+        """
+        Removes all cached results
+        """
+        self._results.clear()
+        self.size = 0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Usage statistics of cache
+
+        Returns
+        -------
+        dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._results),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+        }
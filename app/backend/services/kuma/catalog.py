@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import os
+import sys
+from importlib.metadata import version
+from typing import Any, Dict, Optional
+
+import orjson
+from loguru import logger
+
+from ...core.config import app_config
+
+
+def pandas_version() -> str:
+    """
+    Version of installed pandas, read from package metadata so that pandas is not imported
+
+    Returns
+    -------
+    str
+    """
+    return version("pandas")
+
+
+def build_catalog(mapping: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Inspects pandas module and DataFrame class for functions and their arguments
+
+    Parameters
+    ----------
+    mapping: dict
+        Type mapping used by Inspector
+
+    Returns
+    -------
+    dict with pandas version, 'pd' and 'df' functions
+    """
+    import pandas as pd
+
+    from .inspector import Inspector
+
+    return {
+        "pandas_version": pd.__version__,
+        "pd": Inspector(pd, mapping).functions,
+        "df": Inspector(pd.DataFrame, mapping).functions,
+    }
+
+
+class FunctionCatalog:
+    def __init__(self, directory: str):
+        """
+        Catalog of pandas functions built once per pandas version and stored on disk,
+        served as pre-compressed json.
+
+        Parameters
+        ----------
+        directory: str
+            Directory containing catalog files
+        """
+        self.directory = directory
+        self.data: Optional[Dict[str, Any]] = None
+        self.content = b""
+        self.compressed = b""
+        self.etag = ""
+
+    @property
+    def path(self) -> str:
+        """
+        Path of catalog file for installed pandas version
+
+        Returns
+        -------
+        str
+        """
+        return os.path.join(self.directory, f"pandas-{pandas_version()}.json")
+
+    @property
+    def loaded(self) -> bool:
+        return self.data is not None
+
+    def load(self) -> bool:
+        """
+        Loads catalog of installed pandas version from disk
+
+        Returns
+        -------
+        bool, False if catalog file does not exist
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as catalog_file:
+            content = catalog_file.read()
+        self.data = orjson.loads(content)
+        self.content = content
+        self.compressed = gzip.compress(content)
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        return True
+
+    def write(self, catalog: Dict[str, Any]):
+        """
+        Writes catalog to disk
+
+        Parameters
+        ----------
+        catalog: dict
+            Catalog returned by build_catalog
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"pandas-{catalog['pandas_version']}.json")
+        with open(f"{path}.tmp", "wb") as catalog_file:
+            catalog_file.write(orjson.dumps(catalog))
+        os.replace(f"{path}.tmp", path)
+
+    async def rebuild(self):
+        """
+        Builds catalog in a separate process, so that API process never imports
+        pandas, and loads it
+        """
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", __name__, "--output-dir", self.directory
+        )
+        if await process.wait() != 0:
+            logger.error("Unable to build function catalog")
+            return
+        self.load()
+
+    def functions(self, mod: str) -> Dict[str, Dict]:
+        """
+        Functions of 'pd' module or 'df' class from catalog
+
+        Parameters
+        ----------
+        mod: str
+            'pd' or 'df'
+
+        Returns
+        -------
+        dict
+        """
+        if not self.loaded:
+            raise LookupError("Function catalog is not loaded")
+        return self.data[mod]
+
+
+function_catalog = FunctionCatalog(f"{app_config.DATA_DIR}/catalog")
+
+
+def main():
+    from .mapper import TypeMapper
+
+    parser = argparse.ArgumentParser(description="Builds catalog of pandas functions")
+    parser.add_argument("--mapping", default=f"{app_config.DATA_DIR}/type_mapping.csv")
+    parser.add_argument("--output-dir", default=function_catalog.directory)
+    args = parser.parse_args()
+    catalog = FunctionCatalog(args.output_dir)
+    catalog.write(build_catalog(TypeMapper(args.mapping).mapping))
+    logger.info(f"Function catalog written to {catalog.path}")
+
+
+if __name__ == "__main__":
+    main()
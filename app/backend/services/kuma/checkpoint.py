@@ -0,0 +1,113 @@
+import hashlib
+import os
+from typing import Callable, Dict, Optional
+
+from .storage import FileStorageBackendInterface
+
+
+class CheckpointCache:
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Cache of saved variables written to Parquet files by kernels, keyed by a
+        hash of the steps that produced them. Replaying a session resumes from
+        the newest checkpoint instead of executing every step from scratch.
+
+        Parameters
+        ----------
+        directory: str
+            Directory to store checkpoint files
+        max_bytes: int
+            Maximum total size of checkpoint files, least recently used files
+            are evicted by kernel after writing a checkpoint
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(store: FileStorageBackendInterface, end: int) -> str:
+        """
+        Hash of code of steps up to given index, identical step prefixes of
+        different sessions share the same key
+
+        Parameters
+        ----------
+        store: FileStorageBackendInterface
+        end: int
+            Index after last step
+
+        Returns
+        -------
+        str
+        """
+        code = store.fetch_steps(0, end)
+        return hashlib.sha256(code.encode()).hexdigest()
+
+    def paths(self, store: FileStorageBackendInterface, end: int) -> Dict[str, str]:
+        """
+        Checkpoint file of every variable assigned by steps up to given index
+
+        Parameters
+        ----------
+        store: FileStorageBackendInterface
+        end: int
+            Index after last step
+
+        Returns
+        -------
+        dict, variable name as key and path of checkpoint file as value
+        """
+        key = self.key(store, end)
+        variables = dict.fromkeys(store.fetch_variables(0, end))
+        return {
+            variable: os.path.join(self.directory, f"{key}-{variable}.parquet")
+            for variable in variables
+        }
+
+    def checkpoint_code(self, store: FileStorageBackendInterface) -> str:
+        """
+        Generates code writing all saved variables of current state to checkpoint files
+
+        Parameters
+        ----------
+        store: FileStorageBackendInterface
+
+        Returns
+        -------
+        str
+        """
+        paths = self.paths(store, len(store))
+        code = [
+            f'_kuma.write_checkpoint({variable}, "{path}", {self.max_bytes})'
+            for variable, path in paths.items()
+        ]
+        return "\n".join(code)
+
+    def replay_code(
+        self, store: FileStorageBackendInterface, steps_code: Optional[Callable[[int], str]] = None,
+    ) -> str:
+        """
+        Generates code rebuilding state of a session, variables are restored from
+        newest step having a checkpoint for each of them and only remaining steps
+        are executed
+
+        Parameters
+        ----------
+        store: FileStorageBackendInterface
+        steps_code: Callable, default None
+            Returns code of steps starting from given index, stored code is used if None
+
+        Returns
+        -------
+        str
+        """
+        steps_code = steps_code or store.fetch_steps
+        for end in range(len(store), 0, -1):
+            paths = self.paths(store, end)
+            if paths and all(os.path.exists(path) for path in paths.values()):
+                code = [
+                    f'{variable} = _kuma.read_checkpoint("{path}")'
+                    for variable, path in paths.items()
+                ]
+                code.append(steps_code(end))
+                return "\n".join(code).strip()
+        return steps_code(0)
@@ -1,4 +1,23 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+ARROW_MIME_TYPE = "application/vnd.apache.arrow.stream"
+JSON_MIME_TYPE = "application/vnd.kuma.columns+json"
+TIMINGS_MIME_TYPE = "application/vnd.kuma.timings+json"
+SCHEMA_MIME_TYPE = "application/vnd.kuma.schema+json"
+PROGRESS_MIME_TYPE = "application/vnd.kuma.progress+json"
+DTYPES_MIME_TYPE = "application/vnd.kuma.dtypes+json"
+METRICS_MIME_TYPE = "application/vnd.kuma.metrics+json"
+# comm target registered in kernels, receiving operations instead of code
+COMM_TARGET_NAME = "kuma"
+# columns of an html table, other columns are shown by views with a 'column_offset'
+MAX_DISPLAY_COLUMNS = 50
+# rows read at once by a chunked batch request
+DEFAULT_CHUNKSIZE = 100_000
+# operations applied to each chunk independently, giving the same rows as on whole data
+ROW_LOCAL_FUNCS = ("filter", "query", "assign", "astype", "dropna", "fillna", "rename", "drop")
+# reductions whose results of chunks are combined
+CHUNK_REDUCTIONS = ("sum", "count", "min", "max", "mean")
+OUTPUT_FORMATS = ("html", "arrow", "json")
 
 
 class PandasCodeGenerator:
@@ -9,6 +28,9 @@ class PandasCodeGenerator:
         display_rows: int = 5,
         css_classes: List[str] = None,
         variable: str = "df",
+        output_format: str = "html",
+        source: Optional[str] = None,
+        progress: bool = False,
     ):
         """
         Converts json request to code
@@ -18,6 +40,8 @@ class PandasCodeGenerator:
         request: dict
             A request dictionary containing all information related to code generation
             eg: {"mod": "pd", "func": "read_csv", "args": ["data.csv"], "kwargs": {"index_col": "id"}}
+            with "optimize_dtypes": true, dtypes of a resulting DataFrame are
+            downcast to save memory of kernel
         save: bool, default False
             Whether or not to save the result of code execution to a variable
         display_rows: int, default 10
@@ -26,13 +50,30 @@ class PandasCodeGenerator:
             List of classes to be applied to html table
         variable: str, default "df"
             Variable name to store the result.
+        output_format: str, default "html"
+            Format of displayed result, 'html' prints html table, 'arrow' and
+            'json' publish columnar payload under a custom mime type
+        source: str, default None
+            Variable a request with 'df' mod operates on, 'df' if None
+        progress: bool, default False
+            Whether or not kernel publishes progress of a read_csv request
         """
         self.request = request
         self.save = save
         self.display_rows = display_rows
-        css_classes = " ".join(css_classes)
+        css_classes = " ".join(css_classes or [])
         self.css_classes = f'"{css_classes}"'
         self.variable = variable if save else "_current_state"
+        self.source = source
+        self.progress = progress
+        self.is_view = request.get("type") == "view"
+        if self.is_view:
+            self.variable = "_kuma_view"
+        self.is_batch = request.get("type") == "batch"
+        self.is_chunked = self.is_batch and bool(request.get("chunked"))
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"'output_format' should be one of {OUTPUT_FORMATS}")
+        self.output_format = output_format
 
     def validate(self):
         """
@@ -54,6 +95,100 @@ class PandasCodeGenerator:
         if "" in self.request.get("args", []):
             self.request["args"].remove("")
 
+    def steps(self) -> List["PandasCodeGenerator"]:
+        """
+        Generators of steps stored for a request, a batch request is stored as
+        its operations while a single or chunked request is its own step
+
+        Returns
+        -------
+        list of PandasCodeGenerator
+        """
+        if not self.is_batch or self.is_chunked:
+            return [self]
+        return self.operations()
+
+    def operations(self) -> List["PandasCodeGenerator"]:
+        """
+        Generators of operations of a batch request, eg: {"type": "batch",
+        "steps": [{"mod": "pd", "func": "read_csv", "args": ["data.csv"]},
+        {"mod": "df", "func": "dropna"}]}. Operations on 'df' after the first
+        one are applied to result of previous operation. Dtypes are optimized
+        after the last operation if batch request asks for it.
+
+        Returns
+        -------
+        list of PandasCodeGenerator
+
+        Raises
+        -------
+        ValueError if steps are not a non empty list of requests
+        """
+        steps = self.request.get("steps")
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("'steps' should be a non empty list")
+        if self.request.get("optimize_dtypes") and isinstance(steps[-1], dict):
+            steps = [*steps[:-1], {**steps[-1], "optimize_dtypes": True}]
+        generators = []
+        for step in steps:
+            if not isinstance(step, dict) or step.get("type") in ("batch", "view"):
+                raise ValueError("'steps' should be a list of function requests")
+            source = generators[-1].variable if generators else None
+            generators.append(
+                PandasCodeGenerator(step, self.save, variable=self.variable, source=source)
+            )
+        return generators
+
+    def validate_view(self):
+        """
+        Checks keys of a view request dict, view requests select rows
+        [offset, offset + limit) and optionally a subset of columns of an
+        existing variable, eg: {"type": "view", "variable": "df", "offset": 100,
+        "limit": 50, "columns": ["Name", "Age"]}. An html view shows
+        MAX_DISPLAY_COLUMNS columns starting from 'column_offset'.
+
+        Returns
+        -------
+        None
+        Raises
+        -------
+        ValueError if keys have invalid values
+        """
+        variable = self.request.get("variable", "_current_state")
+        if not isinstance(variable, str) or not variable.isidentifier():
+            raise ValueError("'variable' should be a valid variable name")
+        offset = self.request.get("offset", 0)
+        limit = self.request.get("limit", self.display_rows)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("'offset' should be a non negative int")
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("'limit' should be a positive int")
+        if not isinstance(self.request.get("columns", []), list):
+            raise ValueError("'columns' should be a list")
+        column_offset = self.request.get("column_offset", 0)
+        if not isinstance(column_offset, int) or column_offset < 0:
+            raise ValueError("'column_offset' should be a non negative int")
+        self.display_rows = limit
+
+    def view_code(self) -> str:
+        """
+        Generates code slicing a window of rows and columns from an existing
+        variable without recomputing it, rows are sliced before columns so
+        that only the window is copied
+
+        Returns
+        -------
+        str
+        """
+        variable = self.request.get("variable", "_current_state")
+        offset = self.request.get("offset", 0)
+        columns = self.request.get("columns")
+        code = f"{self.variable} = {variable}.iloc[{offset}:{offset + self.display_rows}]"
+        if columns:
+            code = f"{code}\nif isinstance({self.variable}, pd.DataFrame):"
+            code = f"{code}\n\t{self.variable} = {self.variable}[{columns!r}]"
+        return code
+
     def get_args(self) -> str:
         """
         Formats positional arguments from args key in request dict to str
@@ -119,11 +254,220 @@ class PandasCodeGenerator:
         -------
         str
         """
+        if self.is_chunked:
+            return self.chunked_code()
+        if self.is_batch:
+            return "\n".join(step.user_code() for step in self.operations())
         mod = self.obj_or_module()
+        if mod == "df" and self.source:
+            mod = self.source
         func = self.request["func"]
         call_args = self.call_args()
         code = f"{self.variable} = {mod}.{func}({call_args})"
-        return code
+        return f"{code}{self.optimize_code()}"
+
+    def optimize_code(self) -> str:
+        """
+        Generates code downcasting dtypes of result if request asks for it,
+        along with a report of memory saved by each column
+
+        Returns
+        -------
+        str, empty if dtypes are kept
+        """
+        if not self.request.get("optimize_dtypes"):
+            return ""
+        return f"\n{self.variable} = _kuma.optimize_dtypes({self.variable})"
+
+    def batch_code(self) -> str:
+        """
+        Generates code of all operations of a batch request, time taken by each
+        operation is published before result is displayed, even if an operation
+        fails
+
+        Returns
+        -------
+        str
+        """
+        code = ["_kuma_timings = [_kuma.perf_counter()]", "try:"]
+        for step in self.operations():
+            step.validate()
+            code.extend(f"\t{line}" for line in step.user_code().splitlines())
+            code.append("\t_kuma_timings.append(_kuma.perf_counter())")
+        code.append("finally:\n\t_kuma.publish_timings(_kuma_timings)")
+        return "\n".join(code)
+
+    def chunked_code(self) -> str:
+        """
+        Generates code of a chunked batch request, for data larger than memory
+        of kernel, eg: {"type": "batch", "chunked": True, "chunksize": 100000,
+        "steps": [{"mod": "pd", "func": "read_csv", "args": ["data.csv"]},
+        {"mod": "df", "func": "query", "args": ["Age > 30"]},
+        {"mod": "df", "func": "groupby", "args": ["Sex"]}, {"mod": "df", "func": "mean"}]}
+
+        File of first read_csv operation is read in chunks and row-local
+        operations are applied to each chunk. Pipeline can end with a reduction,
+        optionally grouped, whose results of chunks are combined. Otherwise
+        chunks are written to Parquet file at 'output' and result is a summary
+        of written file.
+
+        Returns
+        -------
+        str
+
+        Raises
+        -------
+        ValueError if pipeline can't be executed in chunks
+        """
+        if self.request.get("optimize_dtypes"):
+            # categories of each chunk would differ
+            raise ValueError("'optimize_dtypes' is not supported in chunked mode")
+        operations = self.operations()
+        for operation in operations:
+            operation.validate()
+        scan, *operations = operations
+        if not scan.is_read_csv:
+            raise ValueError("Chunked requests should start with 'read_csv'")
+        chunksize = self.request.get("chunksize", DEFAULT_CHUNKSIZE)
+        if not isinstance(chunksize, int) or chunksize <= 0:
+            raise ValueError("'chunksize' should be a positive int")
+        reduction = None
+        if operations and operations[-1].request["func"] in CHUNK_REDUCTIONS + ("agg",):
+            reduction = operations.pop()
+        grouping = None
+        if reduction and operations and operations[-1].request["func"] == "groupby":
+            grouping = operations.pop()
+        for operation in operations:
+            self._validate_row_local(operation)
+
+        scan_request = dict(scan.request)
+        scan_request["kwargs"] = {**scan.request.get("kwargs", {}), "chunksize": chunksize}
+        scan_args = PandasCodeGenerator(scan_request).call_args()
+        code = [f"for _kuma_chunk in pd.read_csv({scan_args}):"]
+        for operation in operations:
+            chunk_code = PandasCodeGenerator(
+                operation.request, True, variable="_kuma_chunk", source="_kuma_chunk"
+            ).user_code()
+            code.append(f"\t{chunk_code}")
+        if reduction is None:
+            output = self.request.get("output")
+            if not isinstance(output, str) or not output.endswith(".parquet"):
+                raise ValueError("'output' parquet file is required without a reduction")
+            code.insert(0, f'_kuma_sink = _kuma.ParquetSink("{output}")')
+            code.append("\t_kuma_sink.write(_kuma_chunk)")
+            code.append(f"{self.variable} = _kuma_sink.close()")
+            return "\n".join(code)
+
+        func = reduction.request["func"]
+        if func == "agg":
+            args = reduction.request.get("args", [])
+            kwargs = dict(reduction.request.get("kwargs", {}))
+            funcs = [*args, *([kwargs.pop("func")] if "func" in kwargs else [])]
+            func = funcs[0] if len(funcs) == 1 else None
+            if func not in CHUNK_REDUCTIONS:
+                raise ValueError(
+                    f"'agg' supports a single func, one of {CHUNK_REDUCTIONS} in chunked mode"
+                )
+            reduction = PandasCodeGenerator(
+                {**reduction.request, "func": func, "args": [], "kwargs": kwargs}
+            )
+        target = "_kuma_chunk"
+        if grouping is not None:
+            target = f"_kuma_chunk.groupby({grouping.call_args()})"
+        if func == "mean":
+            kwargs = {"numeric_only": True, **reduction.request.get("kwargs", {})}
+            sums = PandasCodeGenerator({**reduction.request, "kwargs": kwargs}).call_args()
+            partial = f"({target}.sum({sums}), {target}.count())"
+        else:
+            partial = f"{target}.{func}({reduction.call_args()})"
+        code.insert(0, "_kuma_partials = []")
+        code.append(f"\t_kuma_partials.append({partial})")
+        code.append(
+            f"{self.variable} = _kuma.combine_partials("
+            f'_kuma_partials, "{func}", grouped={grouping is not None})'
+        )
+        return "\n".join(code)
+
+    @staticmethod
+    def _validate_row_local(operation: "PandasCodeGenerator"):
+        request = operation.request
+        func = request["func"]
+        kwargs = request.get("kwargs", {})
+        if request.get("mod") != "df" or func not in ROW_LOCAL_FUNCS:
+            raise ValueError(f"'{func}' is not supported in chunked mode")
+        if func == "dropna" and (
+            request.get("args") or kwargs.get("axis") not in (None, 0, "index")
+        ):
+            raise ValueError("'dropna' only drops rows in chunked mode")
+        if func == "fillna" and (
+            len(request.get("args", [])) > 1
+            or kwargs.get("method")
+            or kwargs.get("axis") not in (None, 0, "index")
+        ):
+            raise ValueError("'fillna' only fills with values in chunked mode")
+        if func == "drop" and (
+            "index" in kwargs
+            or (not kwargs.get("columns") and kwargs.get("axis") not in (1, "columns"))
+            or (kwargs.get("columns") and request.get("args"))
+        ):
+            # labels of rows are missing from most chunks
+            raise ValueError("'drop' only drops columns in chunked mode")
+
+    def run_code(self) -> str:
+        """
+        Generates code computing result of request, without displaying it
+
+        Returns
+        -------
+        str
+        """
+        if self.is_view:
+            return self.view_code()
+        if self.is_chunked:
+            return self.chunked_code()
+        if self.is_batch:
+            return self.batch_code()
+        if self.progress and self.is_read_csv:
+            code = f"{self.variable} = _kuma.read_csv_with_progress({self.call_args()})"
+            return f"{code}{self.optimize_code()}"
+        return self.user_code()
+
+    @property
+    def is_read_csv(self) -> bool:
+        return self.request.get("mod") == "pd" and self.request.get("func") == "read_csv"
+
+    def preview_code(self) -> str:
+        """
+        Generates code reading only the first display_rows rows of a read_csv
+        request, along with code publishing schema sampled from those rows.
+        Preview is assigned to '_kuma_preview' and is never stored.
+
+        Returns
+        -------
+        str
+
+        Raises
+        -------
+        ValueError if request is not a read_csv request
+        """
+        if not self.is_read_csv:
+            raise ValueError("Only 'read_csv' requests can be previewed")
+        self.validate()
+        kwargs = self.request.get("kwargs", {})
+        nrows = min(kwargs.get("nrows") or self.display_rows, self.display_rows)
+        request = {**self.request, "kwargs": {**kwargs, "nrows": nrows}}
+        # dtypes sampled from a few rows would differ from those of whole file
+        request.pop("optimize_dtypes", None)
+        preview = PandasCodeGenerator(
+            request,
+            True,
+            self.display_rows,
+            variable="_kuma_preview",
+            output_format=self.output_format,
+        )
+        preview.css_classes = self.css_classes
+        code = preview.user_code()
+        return f"{code}\n_kuma.publish_schema(_kuma_preview)\n{preview.meta_code()}"
 
     def meta_code(self) -> str:
         """
@@ -133,29 +477,45 @@ class PandasCodeGenerator:
         -------
             str
         """
-        pd_html = (
-            f"print({self.variable}.head({self.display_rows}).to_html("
-            f"classes={self.css_classes}, show_dimensions=True))"
-        )
-        series_html = (
-            f"print({self.variable}.to_frame().head({self.display_rows}).to_html("
-            f"classes={self.css_classes}, show_dimensions=True))"
+        if self.output_format != "html":
+            return (
+                f"_kuma.publish_preview({self.variable}, {self.display_rows}, "
+                f'"{self.output_format}")'
+            )
+        column_offset = self.request.get("column_offset", 0) if self.is_view else 0
+        return (
+            f"_kuma.print_table({self.variable}, {self.display_rows}, {self.css_classes}, "
+            f"{column_offset})"
         )
-        code = f"if isinstance({self.variable}, pd.DataFrame):"
-        code = f"{code}\n\t{pd_html}"
-        code = f"{code}\nelif isinstance({self.variable}, pd.Series):"
-        code = f"{code}\n\t{series_html}"
-        return code
 
-    def process(self) -> str:
+    def process(self, state_code: str = "", metrics: bool = False) -> str:
         """
         Combines code generated  by user_code and meta_code functions
 
+        Parameters
+        ----------
+        state_code: str, default ""
+            Code run after user code and before result is displayed, eg.
+            writing checkpoints
+        metrics: bool, default False
+            Whether or not kernel publishes seconds taken to display result,
+            along with memory of kernel and of result if it is saved
+
         Returns
         -------
         str
         """
-        self.validate()
-        code = self.user_code()
-        meta_code = self.meta_code()
-        return f"{code}\n{meta_code}"
+        if self.is_view:
+            self.validate_view()
+        elif not self.is_batch:
+            self.validate()
+        code = [self.run_code()]
+        if state_code:
+            code.append(state_code)
+        if metrics:
+            code.append("_kuma_rendered = _kuma.perf_counter()")
+        code.append(self.meta_code())
+        if metrics:
+            saved = self.variable if self.save else None
+            code.append(f"_kuma.publish_metrics(_kuma_rendered, {saved})")
+        return "\n".join(code)
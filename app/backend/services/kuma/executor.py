@@ -1,10 +1,173 @@
-from queue import Empty
+import asyncio
+import os
+import signal
+import socket
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
 
-from jupyter_client.manager import start_new_async_kernel
+from jupyter_client.asynchronous import AsyncKernelClient
+from jupyter_client.manager import AsyncKernelManager
 from loguru import logger
 
+from ...core.config import app_config
+from .code_generator import COMM_TARGET_NAME, METRICS_MIME_TYPE, TIMINGS_MIME_TYPE
+
+
+OUTPUT_MSG_TYPES = ("stream", "display_data", "execute_result")
+# displays reporting on an execution, kept apart from its result
+REPORT_MIME_TYPES = (METRICS_MIME_TYPE, TIMINGS_MIME_TYPE)
+INTERRUPT_GRACE_PERIOD = 10
+
+
+class Execution:
+    def __init__(self, msg_id: str, stream: bool = False):
+        """
+        Tracks messages of a single execute request sent to jupyter kernel,
+        future is resolved when kernel reports idle state for the request.
+
+        Parameters
+        ----------
+        msg_id: str
+            Message id of execute request, used as parent id by kernel replies
+        stream: bool, default False
+            Whether or not to queue output messages as they arrive
+        """
+        self.msg_id = msg_id
+        self.data: Any = {}
+        # latest published data of each mime type
+        self.displays: Dict[str, Any] = {}
+        self.error: Optional[Dict] = None
+        self.reply: Optional[Dict] = None
+        loop = asyncio.get_event_loop()
+        self.future = loop.create_future()
+        self.outputs: Optional[asyncio.Queue] = asyncio.Queue() if stream else None
+        # loop time when execution was submitted, started and finished by kernel
+        self.submitted_at = loop.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.started = False
+        self.interrupted = False
+        self.outcome: Optional[str] = None
+
+    def handle_iopub(self, msg: Dict):
+        """
+        Updates execution with a message from iopub channel
+
+        Parameters
+        ----------
+        msg: dict
+        """
+        if not "content" in msg:
+            return
+        content = msg["content"]
+        if msg["msg_type"] == "comm_msg":
+            # reply of kuma comm target to an operation
+            reply = content.get("data", {})
+            self.data = reply.get("data", {})
+            if reply.get("status") == "error":
+                logger.error(f"{reply.get('ename')}: {reply.get('evalue')}")
+                self.error = reply
+            return
+        if any(mime_type in content.get("data", {}) for mime_type in REPORT_MIME_TYPES):
+            # published after result, not an output of user code
+            self.displays.update(content["data"])
+            return
+        if msg["msg_type"] == "error":
+            logger.opt(exception=True).error("\n".join(content["traceback"]))
+            self.error = content
+        if self.outputs is not None and msg["msg_type"] in OUTPUT_MSG_TYPES:
+            self.outputs.put_nowait(
+                {"type": msg["msg_type"], "data": content.get("data", content.get("text"))}
+            )
+        if "data" in content:
+            self.data = content["data"]
+            self.displays.update(content["data"])
+        elif "text" in content:
+            self.data = content["text"]
+        if content.get("execution_state") == "busy":
+            self.started = True
+            self.started_at = asyncio.get_event_loop().time()
+        if content.get("execution_state") == "idle":
+            self.finish()
+
+    def handle_shell(self, msg: Dict):
+        """
+        Stores execute reply received on shell channel
+
+        Parameters
+        ----------
+        msg: dict
+        """
+        self.reply = msg.get("content")
+        if self.reply and self.reply.get("status") == "aborted":
+            self.finish("aborted")
+
+    def finish(self, outcome: Optional[str] = None):
+        """
+        Resolves future with data received so far
+
+        Parameters
+        ----------
+        outcome: str, default None
+            Reason for finishing early, eg. 'cancelled', 'timeout' or 'dead'
+        """
+        if outcome and not self.outcome:
+            self.outcome = outcome
+        if not self.future.done():
+            self.finished_at = asyncio.get_event_loop().time()
+            self.future.set_result(self.result)
+            if self.outputs is not None:
+                self.outputs.put_nowait(None)
+
+    @property
+    def status(self) -> str:
+        """
+        Status of execution, 'error' if kernel raised an exception or the reason
+        if execution was cancelled, timed out or kernel died
+
+        Returns
+        -------
+        str
+        """
+        if self.outcome:
+            return self.outcome
+        return "error" if self.error else "ok"
+
+    @property
+    def result(self) -> Any:
+        """
+        Latest output of execution, plain text is preferred for rich outputs
+
+        Returns
+        -------
+        str or dict
+        """
+        data = self.data
+        if "text/plain" in data:
+            data = data["text/plain"]
+        return data
+
 
 class JupyterExecutor:
+    def __init__(self):
+        """
+        Executes code in a jupyter kernel, replies from kernel are read by
+        background tasks and routed to pending executions by parent msg_id.
+        Executions are queued by the executor and sent to kernel one at a time,
+        so that an interrupt only reaches the execution it is meant for.
+        """
+        self._pending: Dict[str, Execution] = {}
+        # executions not sent to kernel yet, along with their message
+        self._queue: Deque[Tuple[Execution, Dict[str, Any]]] = deque()
+        # execution sent to kernel and not finished yet
+        self._running: Optional[Execution] = None
+        self._readers: List[asyncio.Future] = []
+        self.manager: Optional[AsyncKernelManager] = None
+        self._connection_info: Optional[Dict[str, Any]] = None
+        # id of comm opened with kuma comm target of kernel
+        self._comm_id: Optional[str] = None
+
     @classmethod
     async def new(cls):
         """
@@ -19,57 +182,448 @@ class JupyterExecutor:
         await self._startup_code()
         return self
 
+    @classmethod
+    async def attach(cls, connection_info: Dict[str, Any], timeout: float = 10):
+        """
+        Connects to a kernel started by another executor, possibly in another
+        process or host, and returns an instance of JupyterExecutor. Attached
+        executor does not own the kernel, it can't restart it and shutdown
+        only disconnects from it.
+
+        Parameters
+        ----------
+        connection_info: dict
+            Connection info of kernel as returned by connection_info property
+        timeout: float, default 10
+            Seconds to wait for kernel
+
+        Returns
+        -------
+        self
+
+        Raises
+        -------
+        RuntimeError if kernel does not reply within timeout
+        """
+        self = JupyterExecutor()
+        self._connection_info = dict(connection_info)
+        self.client = AsyncKernelClient()
+        self.client.load_connection_info(connection_info)
+        self.client.start_channels()
+        self._start_readers()
+        try:
+            await self._wait_for_ready(timeout)
+        except RuntimeError:
+            await self.shutdown()
+            raise
+        return self
+
     async def start(self):
         """
-        Starts jupyter kernel and adds a manager and client instance to self
+        Starts jupyter kernel, adds a manager and client instance to self and
+        starts reading replies from kernel
         """
-        self.manager, self.client = await start_new_async_kernel()
+        self.manager = AsyncKernelManager(kernel_name="python", ip=app_config.KERNEL_IP)
+        await self.manager.start_kernel()
+        self.client = self.manager.client()
+        self.client.start_channels()
+        try:
+            await self.client.wait_for_ready(timeout=60)
+        except RuntimeError:
+            self.client.stop_channels()
+            await self.manager.shutdown_kernel()
+            raise
+        self._start_readers()
+
+    def _start_readers(self):
+        self._readers = [
+            asyncio.ensure_future(self._read(self.client.get_iopub_msg, "iopub")),
+            asyncio.ensure_future(self._read(self.client.get_shell_msg, "shell")),
+        ]
+
+    @property
+    def owner(self) -> bool:
+        """
+        Whether or not kernel was started by this executor
+
+        Returns
+        -------
+        bool
+        """
+        return self.manager is not None
+
+    @property
+    def connection_info(self) -> Dict[str, Any]:
+        """
+        Connection info of kernel, i.e. content of its connection file along
+        with host and pid of kernel process, used by other processes to attach
+        to the kernel
+
+        Returns
+        -------
+        dict
+        """
+        if self._connection_info is None:
+            info = self.manager.get_connection_info()
+            info["key"] = info["key"].decode()
+            if info["ip"] == "0.0.0.0":
+                # kernel listens on all interfaces, other hosts connect using host name
+                info["ip"] = socket.gethostname()
+            info["host"] = socket.gethostname()
+            info["pid"] = self.manager.kernel.pid
+            self._connection_info = info
+        return self._connection_info
+
+    def memory(self) -> int:
+        """
+        Resident memory of kernel process, read from /proc so it only works on
+        linux and on the host running the kernel
+
+        Returns
+        -------
+        int, bytes used by kernel or 0 if unknown
+        """
+        info = self.connection_info
+        if info.get("host") != socket.gethostname() or not info.get("pid"):
+            return 0
+        try:
+            with open(f"/proc/{info['pid']}/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def _signal_kernel(self, signum: int):
+        """
+        Signals kernel process of an attached executor, only possible on the host
+        running the kernel
+        """
+        info = self.connection_info
+        if info.get("host") != socket.gethostname() or not info.get("pid"):
+            logger.warning(f"Unable to signal kernel on {info.get('host')} from this host")
+            return
+        try:
+            os.kill(info["pid"], signum)
+        except ProcessLookupError:
+            logger.warning(f"Kernel process {info['pid']} does not exist")
+
+    async def _read(self, get_msg, channel: str):
+        """
+        Reads messages from a channel forever and routes them to pending executions
+
+        Parameters
+        ----------
+        get_msg: Callable
+            Coroutine function of client returning next message of channel
+        channel: str
+            Name of channel, either 'iopub' or 'shell'
+        """
+        while True:
+            try:
+                msg = await get_msg()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.opt(exception=True).error(f"Unable to read {channel} message")
+                continue
+            msg_id = msg.get("parent_header", {}).get("msg_id")
+            execution = self._pending.get(msg_id)
+            if execution is None:
+                continue
+            if channel == "iopub":
+                execution.handle_iopub(msg)
+                if execution.future.done():
+                    self._pending.pop(msg_id, None)
+                elif execution.outcome and execution.started and not execution.interrupted:
+                    # execution was cancelled once sent, interrupt as soon as it starts
+                    execution.interrupted = True
+                    asyncio.ensure_future(self.interrupt())
+            else:
+                execution.handle_shell(msg)
+
+    async def _wait_for_ready(self, timeout: float = 60):
+        """
+        Sends kernel_info requests until kernel replies on both shell and iopub channels
+
+        Parameters
+        ----------
+        timeout: float, default 60
+            Seconds to wait for kernel
+
+        Raises
+        -------
+        RuntimeError if kernel does not reply within timeout
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            execution = Execution(self.client.kernel_info())
+            self._pending[execution.msg_id] = execution
+            done, _ = await asyncio.wait({execution.future}, timeout=1)
+            self._pending.pop(execution.msg_id, None)
+            if done:
+                return
+        raise RuntimeError("Kernel didn't respond in %d seconds" % timeout)
 
     async def _startup_code(self):
         """
         Executes basic startup code required for the kernel to execute user code
         """
-        code_str = "import pandas as pd"
-        await self.execute(code_str)
+        code_str = "import pandas as pd\nfrom app.backend.services.kuma import kernel as _kuma"
+        await self.execute(f"{code_str}\n_kuma.register_comm_target()")
+
+    async def reset(self):
+        """
+        Clears every user defined variable from the kernel namespace and executes
+        startup code again, so that kernel can be handed over to another session
+        """
+        await self.execute("%reset -f")
+        await self._startup_code()
+
+    async def is_alive(self) -> bool:
+        """
+        Checks whether jupyter kernel is still running
+
+        Returns
+        -------
+        bool
+        """
+        return await self.client.is_alive()
+
+    async def interrupt(self):
+        """
+        Interrupts code currently running in jupyter kernel
+        """
+        if not self.owner:
+            self._signal_kernel(signal.SIGINT)
+            return
+        await self.manager.interrupt_kernel()
+
+    async def cancel(self, execution: Execution, outcome: str = "cancelled"):
+        """
+        Cancels a submitted execution, a queued execution is never sent to kernel,
+        kernel is interrupted if execution is running, or as soon as it starts
+        if it was already sent
+
+        Parameters
+        ----------
+        execution: Execution
+        outcome: str, default "cancelled"
+            Reason for cancelling, reported as status of execution
+        """
+        if execution.future.done():
+            return
+        queued = [entry for entry in self._queue if entry[0] is execution]
+        if queued:
+            self._queue.remove(queued[0])
+            self._pending.pop(execution.msg_id, None)
+            execution.finish(outcome)
+            return
+        execution.outcome = execution.outcome or outcome
+        if execution.started and not execution.interrupted:
+            execution.interrupted = True
+            await self.interrupt()
+
+    async def kill(self):
+        """
+        Kills jupyter kernel process, used when kernel does not respond to interrupts
+        """
+        if not self.owner:
+            self._signal_kernel(signal.SIGKILL)
+            return
+        await self.manager.signal_kernel(signal.SIGKILL)
+
+    async def restart(self):
+        """
+        Restarts a dead or unresponsive kernel, all pending executions are finished
+        and kernel namespace is lost except for startup code
+
+        Raises
+        -------
+        RuntimeError if kernel is not owned by this executor
+        """
+        if not self.owner:
+            raise RuntimeError("Kernel can only be restarted by the executor that started it")
+        pending, self._pending = self._pending, {}
+        self._queue.clear()
+        for execution in pending.values():
+            execution.finish("dead")
+        await self.manager.restart_kernel(now=True)
+        # ports are kept but kernel runs in a new process
+        self._connection_info = None
+        self._comm_id = None
+        await self._wait_for_ready()
+        await self._startup_code()
+
+    def submit(self, code: str, stream: bool = False) -> Execution:
+        """
+        Queues code for jupyter kernel without waiting for it to finish, submitted
+        executions are sent to kernel in order, once the previous one finished
+
+        Parameters
+        ----------
+        code: str
+            Python code in str format
+        stream: bool, default False
+            Whether or not to queue output messages for streaming
+
+        Returns
+        -------
+        Execution
+        """
+        content = {
+            "code": code,
+            "silent": False,
+            "store_history": True,
+            "user_expressions": {},
+            "allow_stdin": False,
+            # an error or interrupt should not abort executions of other clients
+            # queued in kernel, eg. of attached executors
+            "stop_on_error": False,
+        }
+        return self._enqueue(self.client.session.msg("execute_request", content), stream)
+
+    def _enqueue(self, msg: Dict[str, Any], stream: bool = False) -> Execution:
+        execution = Execution(msg["header"]["msg_id"], stream=stream)
+        self._pending[execution.msg_id] = execution
+        self._queue.append((execution, msg))
+        execution.future.add_done_callback(lambda _: self._send_next())
+        self._send_next()
+        return execution
+
+    def _send_next(self):
+        if self._running is not None and not self._running.future.done():
+            return
+        self._running = None
+        if self._queue:
+            self._running, msg = self._queue.popleft()
+            self.client.shell_channel.send(msg)
+
+    def call(self, operation: Dict[str, Any]) -> Execution:
+        """
+        Sends an operation to kuma comm target of kernel without waiting for
+        it, comm is opened with first operation. Operations and submitted
+        code are run in the order they were sent.
+
+        Parameters
+        ----------
+        operation: dict
+            Operation as generated by KumaSession.call
 
-    async def execute(self, code: str) -> str:
+        Returns
+        -------
+        Execution, its result is the payload sent back by kernel
+        """
+        session = self.client.session
+        if self._comm_id is None:
+            self._comm_id = uuid4().hex
+            content = {"comm_id": self._comm_id, "target_name": COMM_TARGET_NAME, "data": {}}
+            self.client.shell_channel.send(session.msg("comm_open", content))
+        return self._enqueue(session.msg("comm_msg", {"comm_id": self._comm_id, "data": operation}))
+
+    async def execute(self, code: str, timeout: Optional[float] = None) -> str:
         """
         Executes code in jupyter kernel and returns result in str format
         Parameters
         ----------
         code: str
             Python code in str format
+        timeout: float, default None
+            Seconds after which execution is interrupted, waits forever if None
 
         Returns
         -------
         str
         """
-        msg_id = self.client.execute(code)
-        state = "busy"
-        data = {}
-        while state != "idle" and await self.client.is_alive():
-            try:
-                msg = await self.client.get_iopub_msg(timeout=1)
-                if not "content" in msg:
-                    continue
-                content = msg["content"]
-                if msg["msg_type"] == "error":
-                    logger.opt(exception=True).error("\n".join(content["traceback"]))
-                if "data" in content:
-                    data = content["data"]
-                elif "text" in content:
-                    data = content["text"]
-                if "execution_state" in content:
-                    state = content["execution_state"]
-            except Empty:
-                pass
-        if "text/plain" in data:
-            data = data["text/plain"]
-        return data
+        execution = self.submit(code)
+        return await self.wait(execution, timeout)
+
+    async def stream(
+        self, execution: Execution, timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Yields output messages of a submitted execution as soon as they arrive,
+        ends when execution is finished
+
+        Parameters
+        ----------
+        execution: Execution
+            Execution submitted with stream enabled
+        timeout: float, default None
+            Seconds after which execution is interrupted, waits forever if None
+
+        Returns
+        -------
+        AsyncIterator of dict with 'type' and 'data' keys
+        """
+        waiter = asyncio.ensure_future(self.wait(execution, timeout))
+        try:
+            while True:
+                output = await execution.outputs.get()
+                if output is None:
+                    break
+                yield output
+        finally:
+            waiter.cancel()
+
+    async def wait(self, execution: Execution, timeout: Optional[float] = None) -> str:
+        """
+        Waits for a submitted execution to finish, returns data received so far
+        if kernel dies before finishing execution.
+
+        Once timeout expires kernel is interrupted, if kernel is still busy after
+        another INTERRUPT_GRACE_PERIOD seconds it is killed so that watchdog can
+        restart it.
+
+        Parameters
+        ----------
+        execution: Execution
+        timeout: float, default None
+            Seconds after which execution is interrupted, waits forever if None
+
+        Returns
+        -------
+        str
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        killed = False
+        while True:
+            interval = 1 if deadline is None else min(1, max(0, deadline - loop.time()))
+            done, _ = await asyncio.wait({execution.future}, timeout=interval)
+            if done:
+                return execution.future.result()
+            if not await self.is_alive():
+                self._pending.pop(execution.msg_id, None)
+                execution.finish("dead")
+            elif deadline is not None and loop.time() >= deadline:
+                if not execution.started:
+                    # still queued behind other executions, deadline applies once it runs
+                    deadline = loop.time() + timeout
+                elif not execution.interrupted:
+                    logger.warning(f"Execution {execution.msg_id} timed out, interrupting kernel")
+                    await self.cancel(execution, "timeout")
+                    deadline = loop.time() + INTERRUPT_GRACE_PERIOD
+                elif not killed:
+                    logger.error(f"Kernel ignored interrupt for {execution.msg_id}, killing it")
+                    killed = True
+                    await self.kill()
 
     async def shutdown(self):
         """
-        Shutdown jupyter kernel and stop all channels from jupyter client
+        Shutdown jupyter kernel and stop all channels from jupyter client,
+        an attached executor only stops its channels
         """
-        await self.manager.shutdown_kernel()
+        for reader in self._readers:
+            reader.cancel()
+        pending, self._pending = self._pending, {}
+        self._queue.clear()
+        for execution in pending.values():
+            execution.finish("dead")
+        if self.owner:
+            await self.manager.shutdown_kernel()
         self.client.stop_channels()
+        # event loop of heartbeat channel and zmq context of client are never
+        # closed by jupyter_client, context waits for lingering messages to a dead
+        # kernel so it is terminated in a thread
+        self.client.hb_channel.loop.close()
+        await asyncio.get_event_loop().run_in_executor(None, self.client.context.term)
@@ -1,11 +1,34 @@
 import inspect
+import os
 import orjson
-from typing import Any, Callable, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
 
 from docstring_parser import parse
 from loguru import logger
 
 
+def parse_parameter_types(doc: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Parses numpydoc docstring of a function for types of its parameters,
+    defined at module level so that it can run in a process pool
+
+    Parameters
+    ----------
+    doc: str
+        Docstring of function
+
+    Returns
+    -------
+    Dict, a dictionary with keys as argument name and value as type name
+    """
+    parsed_doc = parse(doc or "")
+    return {
+        param.arg_name: param.type_name.split(", default")[0] if param.type_name else None
+        for param in parsed_doc.params
+    }
+
+
 class Inspector:
     def __init__(self, obj: Any, mapping: Dict[str, Any], save: bool = False):
         """
@@ -17,20 +40,20 @@ class Inspector:
         """
         self.obj = obj
         self._functions = None
+        self._members: Optional[Dict[str, Callable]] = None
+        self._resolved: Dict[str, Optional[Dict]] = {}
         self.mapping = mapping
 
     @property
-    def functions(self) -> Dict[str, Dict]:
+    def members(self) -> Dict[str, Callable]:
         """
-        Extracts all functions/methods in a module, class or object
-        along with argument list and default values
+        Public functions/methods in a module, class or object
 
         Returns
         -------
-        Dict, a dictionary with keys as function name and values as dict with
-        keys as argument name and value as default value or type
+        Dict, a dictionary with keys as function name and values as function
         """
-        if not self._functions:
+        if self._members is None:
             try:
                 members = inspect.getmembers(self.obj, inspect.isfunction)
             except NotImplementedError as ni:
@@ -40,14 +63,83 @@ class Inspector:
                     f"Trying to extract from class of obj i.e. from {self.obj.__class__}"
                 )
                 members = inspect.getmembers(self.obj.__class__, inspect.isfunction)
-            result = {
-                member[0]: self.get_default_args(member[1])
-                for member in members
-                if Inspector.is_public(member[0])
+            self._members = {
+                member[0]: member[1] for member in members if Inspector.is_public(member[0])
             }
-            self._functions = result
+        return self._members
+
+    @property
+    def names(self) -> List[str]:
+        """
+        Names of public functions without inspecting their arguments
+
+        Returns
+        -------
+        List of str
+        """
+        return list(self.members)
+
+    def resolve(self, name: str) -> Optional[Dict]:
+        """
+        Extracts arguments of a single function, results are memoized
+
+        Parameters
+        ----------
+        name: str, name of function
+
+        Returns
+        -------
+        Dict, None if arguments are not json compatible
+
+        Raises
+        -------
+        KeyError if function does not exist
+        """
+        if name not in self._resolved:
+            self._resolved[name] = self.get_default_args(self.members[name])
+        return self._resolved[name]
+
+    @property
+    def functions(self) -> Dict[str, Dict]:
+        """
+        Extracts all functions/methods in a module, class or object
+        along with argument list and default values
+
+        Returns
+        -------
+        Dict, a dictionary with keys as function name and values as dict with
+        keys as argument name and value as default value or type
+        """
+        if not self._functions:
+            self._functions = self.build()
         return self._functions
 
+    def build(self, processes: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Extracts arguments of all functions, docstrings are parsed in a process pool
+
+        Parameters
+        ----------
+        processes: int, default None
+            Number of processes to parse docstrings, number of cpus if None
+
+        Returns
+        -------
+        Dict, same as functions
+        """
+        pending = [name for name in self.members if name not in self._resolved]
+        docs = [inspect.getdoc(self.members[name]) for name in pending]
+        processes = processes or os.cpu_count() or 1
+        if processes > 1 and len(docs) > processes:
+            with ProcessPoolExecutor(processes) as pool:
+                chunksize = max(1, len(docs) // (processes * 4))
+                parameter_types = list(pool.map(parse_parameter_types, docs, chunksize=chunksize))
+        else:
+            parameter_types = [parse_parameter_types(doc) for doc in docs]
+        for name, types in zip(pending, parameter_types):
+            self._resolved[name] = self.get_default_args(self.members[name], types)
+        return {name: self._resolved[name] for name in self.members}
+
     @staticmethod
     def is_public(obj: str) -> bool:
         """
@@ -63,13 +155,17 @@ class Inspector:
         """
         return True if not obj.startswith("_") else False
 
-    def get_default_args(self, func: Callable) -> Dict:
+    def get_default_args(
+        self, func: Callable, parameter_types: Optional[Dict[str, Optional[str]]] = None
+    ) -> Dict:
         """
         Extracts arguments and its default values from a function
 
         Parameters
         ----------
         func: Callable
+        parameter_types: Dict, default None
+            Parameter types parsed from docstring, docstring of func is parsed if None
 
         Returns
         -------
@@ -78,17 +174,13 @@ class Inspector:
         if not callable(func):
             raise TypeError(f"{func} is not a callable object")
         signature = inspect.signature(func)
-        doc = inspect.getdoc(func)
-        parsed_doc = parse(doc)
-        parameter_types = {
-            param.arg_name: param.type_name.split(", default")[0] if param.type_name else None
-            for param in parsed_doc.params
-        }
+        if parameter_types is None:
+            parameter_types = parse_parameter_types(inspect.getdoc(func))
         args = {
             k: {
                 "type_name": parameter_types.get(k),
                 "default": v.kind.name if v.default is inspect.Parameter.empty else v.default,
-                **self.mapping.get(parameter_types.get(k)),
+                **(self.mapping.get(parameter_types.get(k)) or {}),
             }
             for k, v in signature.parameters.items()
         }
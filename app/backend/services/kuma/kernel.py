@@ -0,0 +1,618 @@
+"""
+Helpers imported inside jupyter kernels at startup, code generated by
+PandasCodeGenerator calls them to publish results.
+"""
+import base64
+import html
+import io
+import os
+from contextlib import redirect_stdout
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+import pandas as pd
+from IPython import get_ipython
+from IPython.display import publish_display_data
+
+from .code_generator import (
+    ARROW_MIME_TYPE,
+    COMM_TARGET_NAME,
+    DTYPES_MIME_TYPE,
+    JSON_MIME_TYPE,
+    MAX_DISPLAY_COLUMNS,
+    METRICS_MIME_TYPE,
+    PROGRESS_MIME_TYPE,
+    SCHEMA_MIME_TYPE,
+    TIMINGS_MIME_TYPE,
+)
+
+# compression of files read with progress, inferred from file extension like pandas does
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".zip": "zip", ".xz": "xz"}
+# minimum seconds between two progress messages
+PROGRESS_INTERVAL = 0.5
+# maximum ratio of unique values to rows of a string column converted to category
+CATEGORY_MAX_RATIO = 0.5
+
+
+def _preview(obj, rows: int) -> pd.DataFrame:
+    # only rows of preview are converted, a whole Series would be copied
+    preview = obj.head(rows)
+    return preview.to_frame() if isinstance(preview, pd.Series) else preview
+
+
+def _to_arrow(frame: pd.DataFrame, shape) -> bytes:
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(frame)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        table = pa.Table.from_pandas(frame.astype(str))
+    metadata = {**(table.schema.metadata or {}), b"kuma.shape": orjson.dumps(shape)}
+    table = table.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _to_columns(frame: pd.DataFrame, shape) -> str:
+    payload = {
+        "shape": shape,
+        "columns": [str(column) for column in frame.columns],
+        "index": frame.index.tolist(),
+        "data": [frame.iloc[:, position].tolist() for position in range(frame.shape[1])],
+    }
+    return orjson.dumps(payload, default=str).decode()
+
+
+def _format_float(value: Any) -> str:
+    if not isinstance(value, float):
+        return _format_text(value)
+    return "NaN" if value != value else f"{value:.6g}"
+
+
+def _format_text(value: Any) -> str:
+    return html.escape(str(value))
+
+
+@lru_cache(maxsize=None)
+def _formatter(dtype) -> Callable[[Any], str]:
+    """
+    Formatter of values of a dtype, values of numpy integer and boolean dtypes
+    never need to be escaped
+    """
+    if isinstance(dtype, np.dtype) and dtype.kind in "iub":
+        return str
+    if pd.api.types.is_float_dtype(dtype):
+        return _format_float
+    return _format_text
+
+
+def render_table(
+    obj,
+    rows: int,
+    classes: str = "",
+    column_offset: int = 0,
+    max_columns: int = MAX_DISPLAY_COLUMNS,
+) -> Optional[str]:
+    """
+    Renders first rows of a DataFrame or Series as a compact html table,
+    values of each column are formatted by a formatter cached per dtype. Only
+    max_columns columns starting from column_offset are rendered, total
+    number of rows and columns is kept in data attributes of table so that
+    other columns can be shown by a view.
+
+    Parameters
+    ----------
+    obj: Any
+    rows: int
+        Number of rows to be rendered
+    classes: str, default ""
+        css classes of table
+    column_offset: int, default 0
+        Position of first rendered column
+    max_columns: int, default MAX_DISPLAY_COLUMNS
+
+    Returns
+    -------
+    str, None if obj is not a DataFrame or Series
+    """
+    if not isinstance(obj, (pd.DataFrame, pd.Series)):
+        return None
+    total_rows, total_columns = obj.shape if obj.ndim == 2 else (obj.shape[0], 1)
+    frame = _preview(obj, rows)
+    frame = frame.iloc[:, column_offset : column_offset + max_columns]
+    header = "".join(f"<th>{_format_text(column)}</th>" for column in frame.columns)
+    # hidden columns are marked by an ellipsis cell
+    more = "<td>&hellip;</td>" if column_offset + frame.shape[1] < total_columns else ""
+    if more:
+        header = f"{header}<th>&hellip;</th>"
+    columns = [
+        [_formatter(dtype)(value) for value in frame.iloc[:, position].tolist()]
+        for position, dtype in enumerate(frame.dtypes)
+    ]
+    index = [_format_text(label) for label in frame.index.tolist()]
+    body = "".join(
+        f"<tr><th>{label}</th>{''.join(f'<td>{value}</td>' for value in values)}{more}</tr>"
+        for label, values in zip(index, zip(*columns) if columns else [()] * len(index))
+    )
+    return (
+        f'<table class="dataframe {classes}" data-rows="{total_rows}" '
+        f'data-columns="{total_columns}" data-column-offset="{column_offset}">'
+        f"<thead><tr><th></th>{header}</tr></thead><tbody>{body}</tbody></table>"
+        f"<p>{total_rows} rows × {total_columns} columns</p>"
+    )
+
+
+def print_table(obj, rows: int, classes: str = "", column_offset: int = 0):
+    """
+    Prints html table rendered by render_table, other objects are ignored
+
+    Parameters
+    ----------
+    obj: Any
+    rows: int
+    classes: str, default ""
+    column_offset: int, default 0
+    """
+    table = render_table(obj, rows, classes, column_offset)
+    if table is not None:
+        print(table)
+
+
+def preview_payload(obj, rows: int, output_format: str) -> Optional[Dict[str, str]]:
+    """
+    First rows of a DataFrame or Series as columnar payload
+
+    Parameters
+    ----------
+    obj: Any
+        Result of user code
+    rows: int
+        Number of rows in payload
+    output_format: str
+        'arrow' for Arrow IPC stream, 'json' for columnar json
+
+    Returns
+    -------
+    dict with mime type as key, None for other objects
+    """
+    if not isinstance(obj, (pd.DataFrame, pd.Series)):
+        return None
+    shape = list(obj.shape) if obj.ndim == 2 else [obj.shape[0], 1]
+    frame = _preview(obj, rows)
+    if output_format == "arrow":
+        try:
+            return {ARROW_MIME_TYPE: base64.b64encode(_to_arrow(frame, shape)).decode()}
+        except ImportError:
+            pass
+    return {JSON_MIME_TYPE: _to_columns(frame, shape)}
+
+
+def publish_preview(obj, rows: int, output_format: str):
+    """
+    Publishes first rows of a DataFrame or Series as columnar payload,
+    other objects are ignored.
+
+    Parameters
+    ----------
+    obj: Any
+        Result of user code
+    rows: int
+        Number of rows to be published
+    output_format: str
+        'arrow' for Arrow IPC stream, 'json' for columnar json
+    """
+    payload = preview_payload(obj, rows, output_format)
+    if payload is not None:
+        publish_display_data(payload)
+
+
+def call_operation(operation: Dict[str, Any]) -> Tuple[Any, str]:
+    """
+    Calls a pandas function or a method of a variable with arguments of
+    operation and assigns result to variable of operation, value of an
+    attribute which is not callable is used as it is, eg. df.shape
+
+    Parameters
+    ----------
+    operation: dict
+        eg. {"mod": "df", "func": "head", "args": [10], "kwargs": {},
+        "source": "df", "variable": "_current_state"}
+
+    Returns
+    -------
+    tuple of result and text printed by function
+    """
+    namespace = get_ipython().user_ns
+    target = pd if operation["mod"] == "pd" else namespace[operation.get("source") or "df"]
+    attribute = getattr(target, operation["func"])
+    with redirect_stdout(io.StringIO()) as output:
+        if callable(attribute):
+            result = attribute(*operation.get("args", []), **operation.get("kwargs", {}))
+        else:
+            result = attribute
+    namespace[operation["variable"]] = result
+    return result, output.getvalue()
+
+
+def _render(obj, operation: Dict[str, Any]) -> Optional[Any]:
+    rows = operation.get("rows", 5)
+    if operation.get("format", "html") != "html":
+        return preview_payload(obj, rows, operation["format"])
+    return render_table(obj, rows, operation.get("classes", ""))
+
+
+def _on_operation(comm, msg: Dict[str, Any]):
+    operation = msg["content"]["data"]
+    try:
+        result, output = call_operation(operation)
+    except Exception as error:
+        comm.send({"status": "error", "ename": type(error).__name__, "evalue": str(error)})
+        return
+    rendered = perf_counter()
+    data = _render(result, operation) or output
+    if not data and result is not None:
+        # like execute_result of other objects
+        data = {"text/plain": repr(result)}
+    comm.send({"status": "ok", "data": data or {}})
+    publish_metrics(rendered, result if operation.get("save") else None)
+
+
+def register_comm_target():
+    """
+    Registers comm target receiving operations sent by JupyterExecutor.call,
+    each operation is dispatched to pandas directly and its result is sent
+    back on the comm, so that no code is compiled and run by IPython
+    """
+
+    def open_comm(comm, msg: Dict[str, Any]):
+        comm.on_msg(lambda message: _on_operation(comm, message))
+
+    get_ipython().kernel.comm_manager.register_target(COMM_TARGET_NAME, open_comm)
+
+
+def publish_timings(timestamps: List[float]):
+    """
+    Publishes seconds taken by each operation of a batch request
+
+    Parameters
+    ----------
+    timestamps: list of float
+        perf_counter before first operation and after each operation
+    """
+    durations = [end - start for start, end in zip(timestamps, timestamps[1:])]
+    publish_display_data({TIMINGS_MIME_TYPE: orjson.dumps(durations).decode()})
+
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # peak instead of current resident memory, in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def publish_metrics(rendered: float, obj=None):
+    """
+    Publishes seconds taken to display result, along with resident memory of
+    kernel and deep memory usage of a saved result
+
+    Parameters
+    ----------
+    rendered: float
+        perf_counter before result was displayed
+    obj: Any, default None
+        Saved result of user code, memory is not sampled if None
+    """
+    metrics = {"render": perf_counter() - rendered}
+    if obj is not None:
+        metrics["kernel_rss"] = _rss()
+        if isinstance(obj, pd.DataFrame):
+            metrics["memory_usage"] = int(obj.memory_usage(deep=True).sum())
+        elif isinstance(obj, pd.Series):
+            metrics["memory_usage"] = int(obj.memory_usage(deep=True))
+    publish_display_data({METRICS_MIME_TYPE: orjson.dumps(metrics).decode()})
+
+
+def publish_schema(obj):
+    """
+    Publishes column names and dtypes of a DataFrame or Series, other objects
+    are ignored
+
+    Parameters
+    ----------
+    obj: Any
+    """
+    if not isinstance(obj, (pd.DataFrame, pd.Series)):
+        return
+    if isinstance(obj, pd.Series):
+        # named like the column of obj.to_frame(), without copying obj
+        dtypes = [(0 if obj.name is None else obj.name, obj.dtype)]
+    else:
+        dtypes = obj.dtypes.items()
+    schema = [{"name": str(name), "dtype": str(dtype)} for name, dtype in dtypes]
+    publish_display_data({SCHEMA_MIME_TYPE: orjson.dumps(schema).decode()})
+
+
+def _optimize_column(column: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(column):
+        return column
+    if pd.api.types.is_integer_dtype(column):
+        return pd.to_numeric(column, downcast="integer")
+    if pd.api.types.is_float_dtype(column):
+        downcast = pd.to_numeric(column, downcast="float")
+        # float32 is kept only if it holds exactly the same values
+        return downcast if downcast.astype(column.dtype).equals(column) else column
+    if column.dtype == object and len(column):
+        if pd.api.types.infer_dtype(column, skipna=True) != "string":
+            return column
+        if column.nunique() <= CATEGORY_MAX_RATIO * len(column):
+            return column.astype("category")
+    return column
+
+
+def optimize_dtypes(obj, publish: bool = True):
+    """
+    Downcasts integer columns and float columns which fit in smaller dtypes and
+    converts string columns with few unique values to category. Report of
+    dtypes and bytes of each column before and after is published.
+
+    Parameters
+    ----------
+    obj: Any
+        Result of user code, other objects than DataFrame are returned as is
+    publish: bool, default True
+        Whether or not to publish report
+
+    Returns
+    -------
+    DataFrame with optimized dtypes
+    """
+    if not isinstance(obj, pd.DataFrame) or obj.empty:
+        return obj
+    before = obj.memory_usage(deep=True, index=False)
+    optimized = pd.concat([_optimize_column(column) for _, column in obj.items()], axis=1)
+    optimized.columns = obj.columns
+    after = optimized.memory_usage(deep=True, index=False)
+    if publish:
+        columns = [
+            {
+                "name": str(name),
+                "before": str(obj.dtypes.iloc[position]),
+                "after": str(optimized.dtypes.iloc[position]),
+                "bytes_before": int(before.iloc[position]),
+                "bytes_after": int(after.iloc[position]),
+            }
+            for position, name in enumerate(obj.columns)
+        ]
+        report = {
+            "columns": columns,
+            "bytes_before": int(before.sum()),
+            "bytes_after": int(after.sum()),
+        }
+        publish_display_data({DTYPES_MIME_TYPE: orjson.dumps(report).decode()})
+    return optimized
+
+
+class ProgressFile(io.FileIO):
+    def __init__(self, path: str):
+        """
+        Binary file publishing number of bytes read so far, at most once per
+        PROGRESS_INTERVAL seconds and once when file is closed
+
+        Parameters
+        ----------
+        path: str
+        """
+        super().__init__(path, "rb")
+        self.total = os.path.getsize(path)
+        self.loaded = 0
+        self._published = 0.0
+
+    def _advance(self, size: int):
+        self.loaded += size or 0
+        now = perf_counter()
+        if now - self._published >= PROGRESS_INTERVAL:
+            self._published = now
+            self.publish()
+
+    def publish(self):
+        progress = {"loaded": self.loaded, "total": self.total}
+        publish_display_data({PROGRESS_MIME_TYPE: orjson.dumps(progress).decode()})
+
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        self._advance(len(data))
+        return data
+
+    def readinto(self, buffer) -> int:
+        size = super().readinto(buffer)
+        self._advance(size)
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.publish()
+        super().close()
+
+
+def read_csv_with_progress(path, *args, **kwargs):
+    """
+    pd.read_csv publishing progress of parsing a local file, other sources
+    are read without progress
+
+    Parameters
+    ----------
+    path: Any
+        First argument of pd.read_csv
+    args, kwargs:
+        Other arguments of pd.read_csv
+
+    Returns
+    -------
+    DataFrame
+    """
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return pd.read_csv(path, *args, **kwargs)
+    if kwargs.get("compression", "infer") == "infer":
+        extension = os.path.splitext(path)[1].lower()
+        kwargs["compression"] = COMPRESSION_EXTENSIONS.get(extension)
+    with ProgressFile(path) as progress_file:
+        return pd.read_csv(progress_file, *args, **kwargs)
+
+
+def combine_partials(partials: list, reduction: str, grouped: bool = False):
+    """
+    Combines results of a reduction computed on each chunk of data, results
+    of 'mean' are pairs of sums and counts
+
+    Parameters
+    ----------
+    partials: list
+        Results of reduction of each chunk, Series indexed by column or
+        DataFrame indexed by group keys if grouped
+    reduction: str
+        One of 'sum', 'count', 'min', 'max' or 'mean'
+    grouped: bool, default False
+        Whether or not results are grouped
+
+    Returns
+    -------
+    Series or DataFrame
+    """
+
+    def combine(parts, how: str):
+        if not parts:
+            return pd.DataFrame() if grouped else pd.Series(dtype=float)
+        if grouped:
+            frame = pd.concat(parts)
+            return getattr(frame.groupby(level=list(range(frame.index.nlevels))), how)()
+        return getattr(pd.concat(parts, axis=1), how)(axis=1)
+
+    if reduction == "mean":
+        sums = combine([part[0] for part in partials], "sum")
+        counts = combine([part[1] for part in partials], "sum")
+        return sums / (counts[sums.columns] if grouped else counts[sums.index])
+    return combine(partials, "sum" if reduction == "count" else reduction)
+
+
+class ParquetSink:
+    def __init__(self, path: str):
+        """
+        Writes chunks of a DataFrame to a single Parquet file, each chunk is
+        converted with schema of first chunk
+
+        Parameters
+        ----------
+        path: str
+        """
+        import pyarrow  # noqa: F401, fail before reading any chunk
+
+        self.path = path
+        self.rows = 0
+        self._writer = None
+
+    def write(self, chunk: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._writer = pq.ParquetWriter(f"{self.path}.tmp", table.schema)
+        else:
+            table = pa.Table.from_pandas(chunk, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+        self.rows += len(chunk)
+
+    def close(self) -> pd.DataFrame:
+        """
+        Closes file and returns a summary of it, file is only visible at its
+        path once every chunk is written
+
+        Returns
+        -------
+        DataFrame with path, rows and columns of written file
+        """
+        columns = 0
+        if self._writer is not None:
+            columns = len(self._writer.schema)
+            self._writer.close()
+            os.replace(f"{self.path}.tmp", self.path)
+        return pd.DataFrame({"path": [self.path], "rows": [self.rows], "columns": [columns]})
+
+
+def write_checkpoint(obj, path: str, max_bytes: int):
+    """
+    Writes a DataFrame or Series to a Parquet checkpoint file, other objects
+    and frames that can't be converted to Arrow are not checkpointed.
+    Least recently used checkpoints are removed once directory exceeds max_bytes.
+
+    Parameters
+    ----------
+    obj: Any
+        Value of a saved variable
+    path: str
+        Path of checkpoint file
+    max_bytes: int
+        Maximum total size of checkpoint directory
+    """
+    if not isinstance(obj, (pd.DataFrame, pd.Series)):
+        return
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return
+    frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+    try:
+        table = pa.Table.from_pandas(frame)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return
+    if isinstance(obj, pd.Series):
+        table = table.replace_schema_metadata({**table.schema.metadata, b"kuma.series": b"1"})
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    _evict_checkpoints(directory, max_bytes)
+
+
+def read_checkpoint(path: str):
+    """
+    Reads a checkpoint file written by write_checkpoint
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    DataFrame or Series
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    os.utime(path)
+    frame = table.to_pandas()
+    if (table.schema.metadata or {}).get(b"kuma.series"):
+        return frame.iloc[:, 0]
+    return frame
+
+
+def _evict_checkpoints(directory: str, max_bytes: int):
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".parquet")]
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
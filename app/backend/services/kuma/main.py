@@ -1,23 +1,84 @@
-from typing import Any, Dict
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional
 
-import pandas as pd
+import orjson
 
+from ...core.config import app_config
+from .cache import ResultCache
+from .catalog import function_catalog
+from .checkpoint import CheckpointCache
 from .code_generator import PandasCodeGenerator
-from .storage import NotebookStorageBackend
+from .storage import NotebookStorageBackend, StepLogStorageBackend
 from .inspector import Inspector
 from .mapper import TypeMapper
+from .plan import LogicalPlan, operation
+
+# keys of a request which don't change its result
+TRANSPORT_KEYS = ("id", "save", "stream", "timeout", "format", "checkpoint", "rpc")
+# functions returning a different result on every call
+NON_CACHEABLE_FUNCTIONS = ("sample",)
+# functions modifying 'df' in place, besides any function called with inplace=True
+MUTATING_FUNCTIONS = ("pop", "insert", "update", "__setitem__", "__delitem__")
+
+_inspectors: Dict[str, Inspector] = {}
 
 
 class KumaSession:
-    def __init__(self):
+    def __init__(self, session_id: Optional[str] = None, attached: bool = False):
         """
         Represents a session of Kuma, its main responsibility is to maintain
         a jupyter notebook with each cell representing user code.
+
+        Parameters
+        ----------
+        session_id: str, default None
+            Id of session, steps are appended to a log file of the session if
+            given, otherwise they are only kept in memory. Steps of an existing
+            log are restored.
+        attached: bool, default False
+            Whether or not session is attached to a kernel owned by another
+            worker, log of session is shared with that worker
+        """
+        if session_id:
+            self.store = StepLogStorageBackend(self.log_path(session_id), recover=not attached)
+        else:
+            self.store = NotebookStorageBackend()
+        self.mapper = TypeMapper(f"{app_config.DATA_DIR}/type_mapping.csv")
+        self.checkpoints = CheckpointCache(
+            f"{app_config.DATA_DIR}/checkpoints", app_config.CHECKPOINT_MAX_BYTES
+        )
+        self.results = ResultCache(app_config.RESULT_CACHE_MAX_BYTES)
+        # user code of a cached request, executed only if its result is needed in kernel
+        self._pending_state: Optional[str] = None
+        # index of last step saved by code or call, steps of other workers sharing
+        # the log may follow it
+        self.last_step: Optional[int] = None
+
+    @staticmethod
+    def log_path(session_id: str) -> str:
+        """
+        Path of step log of a session, created as soon as session is
+
+        Parameters
+        ----------
+        session_id: str
+
+        Returns
+        -------
+        str
         """
-        self.store = NotebookStorageBackend()
-        self.mapper = TypeMapper("data/type_mapping.csv")
+        return f"{app_config.DATA_DIR}/sessions/{session_id}.jsonl"
 
-    def code(self, request: Dict[str, Any], save: bool = False, display_rows: int = 5) -> str:
+    def code(
+        self,
+        request: Dict[str, Any],
+        save: bool = False,
+        display_rows: int = 5,
+        output_format: str = "html",
+        checkpoint: bool = app_config.CHECKPOINT_STEPS,
+        progress: bool = False,
+    ) -> str:
         """
         Generates code from request using PandasCodeGenerator class and
         stores user code in notebook based on 'save' argument.
@@ -27,47 +88,396 @@ class KumaSession:
         request: dict
             A request dictionary containing all information related to code generation
             eg: {"mod": "pd", "func": "read_csv", "args": ["data.csv"], "kwargs": {"index_col": "id"}}
+            or a batch request with a list of such requests under 'steps', compiled
+            into a single cell
         save: bool, default False
-            Whether or not to save the result of code execution to a variable
+            Whether or not to save the result of code execution to a variable, each
+            step of a batch request is stored separately
         display_rows: int, default 10
             Number of rows to be displayed in html format
+        output_format: str, default "html"
+            Format of displayed result, one of 'html', 'arrow' or 'json'
+        checkpoint: bool, default CHECKPOINT_STEPS from config
+            Whether or not to write saved variables to checkpoint files after a
+            saved step is executed
+        progress: bool, default False
+            Whether or not kernel publishes progress of loading file of a
+            read_csv request
 
         Returns
         -------
         str, user code along with meta code.
 
         """
-        code_gen = PandasCodeGenerator(request, save, display_rows, ["table", "is-fullwidth"])
+        optimized = request
+        if request.get("type") == "batch" and isinstance(request.get("steps"), list):
+            optimized = {**request, "steps": LogicalPlan(request["steps"]).optimize()}
+        code_gen = PandasCodeGenerator(
+            optimized,
+            save,
+            display_rows,
+            ["table", "is-fullwidth"],
+            output_format=output_format,
+            progress=progress,
+        )
+        code = code_gen.process(metrics=True)
         if save:
-            user_code = code_gen.user_code()
-            self.store.step(code=user_code)
-        return code_gen.process()
+            # requests are stored as sent, they are optimized again on replay
+            originals = PandasCodeGenerator(request, save).steps()
+            for step, original in zip(code_gen.steps(), originals):
+                # chunked requests have no single operation, they are replayed as stored
+                stored = None if step.is_chunked else operation(original.request)
+                self.last_step = self.store.step(
+                    code=step.user_code(), variable=step.variable, request=stored
+                )
+            self.results.clear()
+            if checkpoint:
+                checkpoint_code = self.checkpoints.checkpoint_code(self.store)
+                code = code_gen.process(checkpoint_code, metrics=True)
+            return self._with_pending_state(code)
+        self._pending_state = None
+        if self.mutates_state(request):
+            self.results.clear()
+        return code
+
+    def call(
+        self,
+        request: Dict[str, Any],
+        save: bool = False,
+        display_rows: int = 5,
+        output_format: str = "html",
+        checkpoint: bool = app_config.CHECKPOINT_STEPS,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Generates an operation sent to kuma comm target of kernel by
+        JupyterExecutor.call, so that a single function request is run without
+        compiling code. Code of request is still stored in notebook if it is saved.
+
+        Parameters
+        ----------
+        request: dict
+            eg: {"mod": "df", "func": "head", "args": [10]}
+        save: bool, default False
+            Whether or not to save the result to a variable
+        display_rows: int, default 5
+            Number of rows of result sent back
+        output_format: str, default "html"
+            Format of result, one of 'html', 'arrow' or 'json'
+        checkpoint: bool, default CHECKPOINT_STEPS from config
+            Saved requests are not sent as operations if they are checkpointed
+
+        Returns
+        -------
+        dict, None if request has to be executed as code
+        """
+        if request.get("type") or request.get("optimize_dtypes"):
+            return None
+        if save and (checkpoint or self._pending_state):
+            return None
+        code_gen = PandasCodeGenerator(
+            request, save, display_rows, ["table", "is-fullwidth"], output_format=output_format,
+        )
+        code_gen.validate()
+        payload = {
+            "mod": code_gen.obj_or_module(),
+            "func": request["func"],
+            "args": request.get("args", []),
+            "kwargs": request.get("kwargs", {}),
+            "variable": code_gen.variable,
+            "save": save,
+            "rows": display_rows,
+            "format": output_format,
+            "classes": " ".join(["table", "is-fullwidth"]),
+        }
+        if save:
+            self.last_step = self.store.step(
+                code=code_gen.user_code(), variable=code_gen.variable, request=operation(request)
+            )
+            self.results.clear()
+        else:
+            self._pending_state = None
+            if self.mutates_state(request):
+                self.results.clear()
+        return payload
+
+    def record_metrics(self, step: int, metrics: Dict[str, Any]):
+        """
+        Stores performance figures of executing a saved step along with it
+
+        Parameters
+        ----------
+        step: int
+            Index of step in store
+        metrics: dict
+            eg. {"phases": {"execute": 0.2}, "kernel_rss": 104857600, "memory_usage": 1024}
+        """
+        self.store.record_metrics(step, metrics)
+
+    def _with_pending_state(self, code: str) -> str:
+        if self._pending_state:
+            code = f"{self._pending_state}\n{code}"
+            self._pending_state = None
+        return code
+
+    @staticmethod
+    def mutates_state(request: Dict[str, Any]) -> bool:
+        """
+        Whether or not a request, or a step of a batch request, may modify
+        'df' in place, so that results cached for stored steps become stale
+
+        Parameters
+        ----------
+        request: dict
+
+        Returns
+        -------
+        bool
+        """
+        steps = request.get("steps") if request.get("type") == "batch" else [request]
+        if not isinstance(steps, list):
+            return False
+        for step in steps:
+            if not isinstance(step, dict):
+                continue
+            kwargs = step.get("kwargs")
+            if step.get("func") in MUTATING_FUNCTIONS or (
+                isinstance(kwargs, dict) and kwargs.get("inplace")
+            ):
+                return True
+        return False
+
+    def result_key(
+        self, request: Dict[str, Any], display_rows: int = 5, output_format: str = "html"
+    ) -> Optional[str]:
+        """
+        Key of a read-only request for result cache, made of hash of stored steps,
+        normalized request and display options. Only requests on session state
+        i.e. 'df' mod are cacheable.
+
+        Parameters
+        ----------
+        request: dict
+        display_rows: int, default 5
+        output_format: str, default "html"
+
+        Returns
+        -------
+        str, None if request is not cacheable
+        """
+        if (
+            request.get("mod") != "df"
+            or request.get("func") in NON_CACHEABLE_FUNCTIONS
+            or self.mutates_state(request)
+        ):
+            return None
+        normalized = {k: v for k, v in request.items() if k not in TRANSPORT_KEYS}
+        steps = self.checkpoints.key(self.store, len(self.store))
+        payload = orjson.dumps(
+            [steps, normalized, display_rows, output_format], option=orjson.OPT_SORT_KEYS
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def cached_result(self, key: str, request: Dict[str, Any]) -> Optional[Any]:
+        """
+        Returns cached result of a read-only request. Code of request is kept
+        pending, it is executed before the next step which could depend on
+        '_current_state' in kernel.
+
+        Parameters
+        ----------
+        key: str
+            Key returned by result_key
+        request: dict
+
+        Returns
+        -------
+        Any, None if result is not cached
+        """
+        result = self.results.get(key)
+        if result is not None:
+            code_gen = PandasCodeGenerator(request)
+            code_gen.validate()
+            self._pending_state = code_gen.user_code()
+        return result
+
+    def cache_result(self, key: str, result: Any):
+        """
+        Caches result of a read-only request
+
+        Parameters
+        ----------
+        key: str
+            Key returned by result_key
+        result: Any
+        """
+        self.results.put(key, result)
+
+    def replay_code(self) -> str:
+        """
+        Generates code rebuilding session state in a new kernel, starting from
+        newest checkpoint of saved steps when available
+
+        Returns
+        -------
+        str
+        """
+        return self.checkpoints.replay_code(self.store, self.optimized_steps)
+
+    def optimized_steps(self, start: int = 0) -> str:
+        """
+        Generates code of stored steps starting from given index, rewritten by
+        LogicalPlan. Stored code is used if a step has no stored request.
+
+        Parameters
+        ----------
+        start: int, default 0
+            Index of first step
+
+        Returns
+        -------
+        str
+        """
+        requests = self.store.fetch_requests(start)
+        variables = self.store.fetch_variables(start)
+        # plan assumes every step assigns 'df', as saved steps do
+        if None in requests or variables != ["df"] * len(requests):
+            return self.store.fetch_steps(start)
+        code = [
+            PandasCodeGenerator(request, save=True).user_code()
+            for request in LogicalPlan(requests).optimize()
+        ]
+        return "\n".join(code)
+
+    def preview(
+        self, request: Dict[str, Any], display_rows: int = 5, output_format: str = "html"
+    ) -> str:
+        """
+        Generates code reading and displaying only first rows of file of a
+        read_csv request along with its sampled schema, so that they are shown
+        before the whole file is loaded. Previews are never stored in notebook.
+
+        Parameters
+        ----------
+        request: dict
+            A read_csv request dictionary
+        display_rows: int, default 5
+            Number of rows to be read and displayed
+        output_format: str, default "html"
+            Format of displayed result, one of 'html', 'arrow' or 'json'
+
+        Returns
+        -------
+        str
+        """
+        code_gen = PandasCodeGenerator(
+            request, False, display_rows, ["table", "is-fullwidth"], output_format=output_format
+        )
+        return code_gen.preview_code()
+
+    def view(
+        self, request: Dict[str, Any], display_rows: int = 5, output_format: str = "html"
+    ) -> str:
+        """
+        Generates code displaying a window of an existing variable, eg. the
+        result of the last request, without executing the operation again.
+        Views are never stored in notebook.
+
+        Parameters
+        ----------
+        request: dict
+            A view request dictionary
+            eg: {"type": "view", "variable": "df", "offset": 100, "limit": 50, "columns": ["Age"]}
+        display_rows: int, default 5
+            Number of rows to be displayed if request has no 'limit'
+        output_format: str, default "html"
+            Format of displayed result, one of 'html', 'arrow' or 'json'
+
+        Returns
+        -------
+        str, view code along with meta code.
+        """
+        request = {**request, "type": "view"}
+        code_gen = PandasCodeGenerator(
+            request, False, display_rows, ["table", "is-fullwidth"], output_format=output_format
+        )
+        code = code_gen.process()
+        if request.get("variable", "_current_state") == "_current_state":
+            code = self._with_pending_state(code)
+        return code
 
     @property
     def df_functions(self) -> Dict[str, Dict]:
         """
-        Using Inspector class, it returns dictionary of functions with
-        its arguments under a Dataframe class.
+        Returns dictionary of functions with its arguments under a Dataframe
+        class from function catalog, falls back to Inspector class if catalog
+        is not loaded.
 
         Returns
         -------
         dict
         """
-        inspector = Inspector(pd.DataFrame, self.mapper.mapping)
-        return inspector.functions
+        if function_catalog.loaded:
+            return function_catalog.functions("df")
+        return self.inspector("df").functions
 
     @property
     def pd_functions(self) -> Dict[str, Dict]:
         """
-        Using Inspector class, it returns dictionary of functions with
-        its arguments under pandas module.
+        Returns dictionary of functions with its arguments under pandas module
+        from function catalog, falls back to Inspector class if catalog is not
+        loaded.
 
         Returns
         -------
         dict
         """
-        inspector = Inspector(pd, self.mapper.mapping)
-        return inspector.functions
+        if function_catalog.loaded:
+            return function_catalog.functions("pd")
+        return self.inspector("pd").functions
+
+    def inspector(self, mod: str) -> Inspector:
+        """
+        Inspector of pandas module or DataFrame class, shared by all sessions so
+        that resolved functions are memoized. pandas is imported only here, API
+        process never imports it when function catalog is loaded.
+
+        Parameters
+        ----------
+        mod: str
+            'pd' or 'df'
+
+        Returns
+        -------
+        Inspector
+        """
+        if mod not in _inspectors:
+            import pandas as pd
+
+            _inspectors[mod] = Inspector(pd.DataFrame if mod == "df" else pd, self.mapper.mapping)
+        return _inspectors[mod]
+
+    def function(self, mod: str, name: str) -> Optional[Dict]:
+        """
+        Returns arguments of a single function from function catalog, only this
+        function is inspected if catalog is not loaded.
+
+        Parameters
+        ----------
+        mod: str
+            'pd' or 'df'
+        name: str
+            Name of function
+
+        Returns
+        -------
+        dict, None if function does not exist
+        """
+        if function_catalog.loaded:
+            return function_catalog.functions(mod).get(name)
+        try:
+            return self.inspector(mod).resolve(name)
+        except KeyError:
+            return None
 
     def save(self, file_path: str):
         """
@@ -79,3 +489,29 @@ class KumaSession:
             Relative or absolute path of file
         """
         self.store.save(file_path)
+
+    async def export(self, file_path: str):
+        """
+        Saves notebook to given file path in a thread, so that event loop is not
+        blocked while notebook is written
+
+        Parameters
+        ----------
+        file_path: str
+            Relative or absolute path of file
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.save, file_path)
+
+    async def close(self, file_path: Optional[str] = None):
+        """
+        Closes store of session, notebook is exported first if file path is given
+        and log of steps is removed once exported
+
+        Parameters
+        ----------
+        file_path: str, default None
+            Relative or absolute path of exported notebook
+        """
+        if file_path:
+            await self.export(file_path)
+        self.store.close(remove=bool(file_path))
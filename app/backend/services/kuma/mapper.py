@@ -1,15 +1,77 @@
+import csv
+import os
 from pathlib import Path
-from typing import Any, Dict
-import pandas as pd
+from typing import Any, Dict, Tuple, Union
+
+from loguru import logger
+
+# compiled mappings by file path along with modification time of file
+_compiled: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _convert(value: str) -> Any:
+    """
+    Converts a csv cell to python value like pandas would, empty cells become None
+    """
+    if value == "":
+        return None
+    if value in ("True", "False"):
+        return value == "True"
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def compile_mapping(mapping_file: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Reads type mapping csv into a dictionary with 'types' column as keys and
+    remaining columns as values
+
+    Parameters
+    ----------
+    mapping_file: str or Path
+
+    Returns
+    -------
+    dict
+    """
+    with open(mapping_file, newline="") as csv_file:
+        rows = csv.DictReader(csv_file)
+        return {
+            row.pop("types"): {column: _convert(value) for column, value in row.items()}
+            for row in rows
+        }
 
 
 class TypeMapper:
-    def __init__(self, mapping_file: Path):
+    def __init__(self, mapping_file: Union[str, Path]):
+        """
+        Maps type names found in docstrings to ui specific details. Mapping file
+        is compiled once per process and compiled again only when it is modified.
+
+        Parameters
+        ----------
+        mapping_file: str or Path
+            Path of csv file with a 'types' column
+        """
         self.mapping_file = mapping_file
-        self.mapping = self._load_types()
+
+    @property
+    def mapping(self) -> Dict[str, Any]:
+        return self._load_types()
 
     def _load_types(self) -> Dict[str, Any]:
-        df = pd.read_csv(self.mapping_file)
-        df = df.set_index("types")
-        data = df.to_dict(orient="index")
-        return data
+        path = str(self.mapping_file)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            logger.warning(f"Type mapping file {path} not found")
+            return {}
+        compiled = _compiled.get(path)
+        if compiled is None or compiled[0] != mtime:
+            compiled = (mtime, compile_mapping(path))
+            _compiled[path] = compiled
+        return compiled[1]
@@ -0,0 +1,207 @@
+import copy
+from typing import Any, Dict, List, Optional
+
+# keys of a request describing the operation, other keys only affect transport or display
+OPERATION_KEYS = ("mod", "func", "args", "kwargs", "optimize_dtypes")
+# read_csv arguments changing the kind of result or the meaning of positional columns, or
+# which can't be combined with nrows
+PUSHDOWN_BLOCKERS = ("chunksize", "iterator", "header", "names", "squeeze", "skipfooter")
+# read_csv arguments naming columns, which should still be read once usecols is pushed
+COLUMN_ARGUMENTS = ("index_col", "parse_dates", "converters", "dtype")
+# dtypes for which parsing a column gives the same values as casting it after parsing
+PUSHDOWN_DTYPES = ("float", "float16", "float32", "float64")
+
+
+class ColumnFilter(list):
+    """
+    Columns pushed into read_csv, rendered in generated code as a callable
+    usecols, which unlike a list ignores columns missing from the file, the
+    same way as DataFrame.filter(items=...)
+    """
+
+    def __repr__(self) -> str:
+        return f"lambda column: column in {tuple(self)!r}"
+
+    __str__ = __repr__
+
+
+def operation(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Operation of a request without transport and display keys
+
+    Parameters
+    ----------
+    request: dict
+
+    Returns
+    -------
+    dict
+    """
+    return {key: copy.deepcopy(request[key]) for key in OPERATION_KEYS if key in request}
+
+
+class LogicalPlan:
+    def __init__(self, requests: List[Dict[str, Any]]):
+        """
+        Lightweight logical plan of a pipeline of requests, where each request
+        with 'df' mod operates on the result of previous request. Plan is
+        rewritten to push column selection, dtype casts and row limits into
+        read_csv, so that the parser skips columns and rows which are
+        dropped right after loading. Rewritten operations are kept, so that
+        result of pipeline does not change.
+
+        Parameters
+        ----------
+        requests: list of dict
+            Requests of pipeline in order, eg. steps of a batch request
+        """
+        self.requests = [operation(request) for request in requests]
+
+    def optimize(self) -> List[Dict[str, Any]]:
+        """
+        Rewrites pipeline, a read_csv request absorbs following 'df' requests
+        until a request which can't be pushed down or whose dtypes are
+        optimized, as optimized dtypes depend on every row of result
+
+        Returns
+        -------
+        list of dict, rewritten requests
+        """
+        scan: Optional[Dict[str, Any]] = None
+        for request in self.requests:
+            if request.get("mod") == "pd" and request.get("func") == "read_csv":
+                scan = request if self._pushable_scan(request) else None
+            elif scan is not None and not (
+                request.get("mod") == "df" and self._push(scan, request)
+            ):
+                scan = None
+            if request.get("optimize_dtypes"):
+                scan = None
+        return self.requests
+
+    @staticmethod
+    def _pushable_scan(request: Dict[str, Any]) -> bool:
+        kwargs = request.get("kwargs", {})
+        if not isinstance(kwargs, dict) or not isinstance(request.get("args", []), list):
+            return False
+        return len(request.get("args", [])) <= 1 and not any(k in kwargs for k in PUSHDOWN_BLOCKERS)
+
+    @staticmethod
+    def _argument(request: Dict[str, Any], name: str, position: int = 0, default: Any = None):
+        args = request.get("args", [])
+        kwargs = request.get("kwargs", {})
+        if not isinstance(args, list) or not isinstance(kwargs, dict):
+            return None
+        if name in kwargs:
+            return kwargs[name]
+        return args[position] if len(args) > position else default
+
+    def _push(self, scan: Dict[str, Any], request: Dict[str, Any]) -> bool:
+        """
+        Pushes a request into read_csv request
+
+        Parameters
+        ----------
+        scan: dict
+            read_csv request, updated in place
+        request: dict
+            Request operating on result of read_csv
+
+        Returns
+        -------
+        bool, False if request can't be pushed down
+        """
+        func = request.get("func")
+        kwargs = request.get("kwargs", {})
+        if func == "head":
+            return self._push_nrows(scan, self._argument(request, "n", default=5))
+        if func == "filter":
+            extra = set(kwargs) - {"items"}
+            if extra or len(request.get("args", [])) > 1:
+                return False
+            return self._push_usecols(scan, self._argument(request, "items"))
+        if func == "astype":
+            # read time dtype raises where eg. errors="ignore" would keep a column
+            if set(kwargs) - {"dtype"} or len(request.get("args", [])) > 1:
+                return False
+            return self._push_dtype(scan, self._argument(request, "dtype"))
+        return False
+
+    @staticmethod
+    def _push_nrows(scan: Dict[str, Any], rows: Any) -> bool:
+        if not isinstance(rows, int) or isinstance(rows, bool) or rows < 0:
+            return False
+        kwargs = scan.setdefault("kwargs", {})
+        nrows = kwargs.get("nrows")
+        kwargs["nrows"] = rows if nrows is None else min(nrows, rows)
+        return True
+
+    @staticmethod
+    def _push_usecols(scan: Dict[str, Any], items: Any) -> bool:
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            return False
+        kwargs = scan.setdefault("kwargs", {})
+        named = LogicalPlan._named_columns(kwargs)
+        if named is None:
+            return False
+        usecols = kwargs.get("usecols")
+        if usecols is not None and not isinstance(usecols, ColumnFilter):
+            # a list of usecols raises for missing columns, narrowing it would not
+            return False
+        columns = ColumnFilter(item for item in items if usecols is None or item in usecols)
+        # columns named by other arguments are read and dropped by filter afterwards
+        columns.extend(column for column in dict.fromkeys(named) if column not in columns)
+        kwargs["usecols"] = columns
+        return True
+
+    @staticmethod
+    def _named_columns(kwargs: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Names of columns read_csv arguments refer to
+
+        Parameters
+        ----------
+        kwargs: dict
+            Keyword arguments of read_csv
+
+        Returns
+        -------
+        list of str, None if an argument refers to columns by position or in
+        a way which is not understood
+        """
+        named: List[str] = []
+        for key in COLUMN_ARGUMENTS:
+            value = kwargs.get(key)
+            if value is None or isinstance(value, bool):
+                # eg. parse_dates=True parses index, index_col=False
+                continue
+            if key == "dtype" and not isinstance(value, dict):
+                # a single dtype of every column
+                continue
+            if key == "parse_dates" and isinstance(value, dict):
+                value = [column for columns in value.values() for column in columns]
+            elif key == "parse_dates" and isinstance(value, list):
+                value = [
+                    column
+                    for item in value
+                    for column in (item if isinstance(item, list) else [item])
+                ]
+            elif isinstance(value, dict):
+                value = list(value)
+            elif isinstance(value, str):
+                value = [value]
+            if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+                # positional columns refer to columns before usecols is applied
+                return None
+            named.extend(value)
+        return named
+
+    @staticmethod
+    def _push_dtype(scan: Dict[str, Any], dtype: Any) -> bool:
+        if not isinstance(dtype, dict) or not all(v in PUSHDOWN_DTYPES for v in dtype.values()):
+            return False
+        kwargs = scan.setdefault("kwargs", {})
+        if kwargs.get("dtype") is not None and not isinstance(kwargs["dtype"], dict):
+            return False
+        kwargs["dtype"] = {**kwargs.get("dtype", {}), **dtype}
+        return True
@@ -0,0 +1,156 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from ...core.config import app_config
+from .executor import JupyterExecutor
+
+
+class KernelPool:
+    def __init__(
+        self,
+        min_size: int = 1,
+        max_size: int = 4,
+        reset_timeout: float = app_config.KERNEL_RESET_TIMEOUT,
+    ):
+        """
+        Keeps started jupyter kernels, with startup code already executed,
+        ready to be checked out by sessions.
+
+        Parameters
+        ----------
+        min_size: int, default 1
+            Number of idle kernels the pool keeps warm, refilled in background
+        max_size: int, default 4
+            Maximum number of idle kernels kept in pool, kernels returned
+            beyond this limit are shutdown
+        reset_timeout: float, default KERNEL_RESET_TIMEOUT from config
+            Seconds a returned kernel has to reset, it is killed otherwise
+        """
+        if min_size < 0 or max_size < min_size:
+            raise ValueError("'min_size' should be non-negative and not greater than 'max_size'")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.reset_timeout = reset_timeout
+        self._idle: List[JupyterExecutor] = []
+        self._refill_task: Optional[asyncio.Future] = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.retired = 0
+
+    async def start(self):
+        """
+        Starts filling the pool in background
+        """
+        self._closed = False
+        self._schedule_refill()
+
+    async def acquire(self) -> JupyterExecutor:
+        """
+        Checks out a warm kernel from the pool, starts a new one if pool is empty
+
+        Returns
+        -------
+        JupyterExecutor
+        """
+        while self._idle:
+            executor = self._idle.pop(0)
+            if await executor.is_alive():
+                self.hits += 1
+                self._schedule_refill()
+                return executor
+            await self._retire(executor)
+        self.misses += 1
+        self._schedule_refill()
+        return await JupyterExecutor.new()
+
+    async def release(self, executor: JupyterExecutor):
+        """
+        Returns kernel to the pool after resetting its namespace, kernel is
+        shutdown instead if pool is full, closed or kernel is not healthy. Code
+        still running is interrupted first, a kernel which doesn't reset within
+        reset_timeout seconds is killed and replaced.
+
+        Parameters
+        ----------
+        executor: JupyterExecutor
+        """
+        if self._closed or len(self._idle) >= self.max_size or not await executor.is_alive():
+            await self._retire(executor)
+            return
+        try:
+            await executor.interrupt()
+            await asyncio.wait_for(executor.reset(), self.reset_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Kernel did not reset within {self.reset_timeout} seconds, killing it")
+            await self._retire(executor, kill=True)
+            self._schedule_refill()
+            return
+        except Exception:
+            logger.opt(exception=True).warning("Unable to reset kernel, retiring it")
+            await self._retire(executor)
+            return
+        self._idle.append(executor)
+
+    async def close(self):
+        """
+        Stops refilling, waits for a kernel being started and shuts down all idle kernels
+        """
+        self._closed = True
+        if self._refill_task and not self._refill_task.done():
+            await self._refill_task
+        idle, self._idle = self._idle, []
+        for executor in idle:
+            await self._retire(executor)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Usage statistics of the pool
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "retired": self.retired,
+            "idle": len(self._idle),
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+
+    def _schedule_refill(self):
+        if self._closed or len(self._idle) >= self.min_size:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.ensure_future(self._refill())
+
+    async def _refill(self):
+        while not self._closed and len(self._idle) < self.min_size:
+            try:
+                executor = await JupyterExecutor.new()
+            except Exception:
+                logger.opt(exception=True).error("Unable to start kernel for pool")
+                return
+            if self._closed:
+                await self._retire(executor)
+                return
+            self._idle.append(executor)
+            logger.debug(f"Kernel added to pool, {len(self._idle)} idle")
+
+    async def _retire(self, executor: JupyterExecutor, kill: bool = False):
+        self.retired += 1
+        try:
+            if kill:
+                # a busy kernel would only be killed after shutdown request times out
+                await executor.kill()
+            await executor.shutdown()
+        except Exception:
+            logger.opt(exception=True).warning("Unable to shutdown kernel")
+
+
+kernel_pool = KernelPool(app_config.KERNEL_POOL_MIN_SIZE, app_config.KERNEL_POOL_MAX_SIZE)
@@ -1,6 +1,11 @@
 import abc
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
 import nbformat.v4 as notebook
+import orjson
+from loguru import logger
 from nbformat import write as write_notebook, read as read_notebook
 
 
@@ -18,14 +23,26 @@ class FileStorageBackendInterface(metaclass=abc.ABCMeta):
         )
 
     @abc.abstractmethod
-    def step(self, code: str) -> int:
+    def step(self, code: str, variable: str = None, request: Dict[str, Any] = None) -> int:
         """
         Save steps into some kind of store
         :param code: Code to store eg. df = pd.read_csv("file.csv")
+        :param variable: Name of variable assigned by code eg. df
+        :param request: Operation of request which generated code
         :return: Identifier step number
         """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def record_metrics(self, index: int, metrics: Dict[str, Any]):
+        """
+        Store performance figures of executing a step
+        :param index: Step number
+        :param metrics: Figures eg. {"phases": {"execute": 0.2}, "kernel_rss": 104857600}
+        :return: None
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def fetch_steps(self, start: int = None, end: int = None) -> str:
         """
@@ -35,6 +52,33 @@ class FileStorageBackendInterface(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def fetch_variables(self, start: int = None, end: int = None) -> List[str]:
+        """
+        Get names of variables assigned by steps in order
+        :param start: Index of first step
+        :param end: Index after last step
+        :return: List of variable names
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fetch_requests(self, start: int = None, end: int = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Get operations of requests which generated steps in order
+        :param start: Index of first step
+        :param end: Index after last step
+        :return: List of operations, None for steps stored without request
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """
+        Number of steps in store
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def save(self, file_name: str):
         """
@@ -44,6 +88,13 @@ class FileStorageBackendInterface(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def close(self, remove: bool = False):
+        """
+        Release resources held by store, store is not used afterwards
+        :param remove: Whether or not to remove persisted steps
+        :return: None
+        """
+
 
 class NotebookStorageBackend(FileStorageBackendInterface):
     def __init__(self, path_to_notebook: str = None):
@@ -56,22 +107,80 @@ class NotebookStorageBackend(FileStorageBackendInterface):
             self.notebook = notebook.new_notebook()
             self.notebook["cells"] = []
 
-    def step(self, code: str) -> int:
+    def step(self, code: str, variable: str = None, request: Dict[str, Any] = None) -> int:
         """
         Takes user code and writes to a cell of notebook
 
         Parameters
         ----------
         code: str
+        variable: str, default None
+            Name of variable assigned by code, stored in cell metadata
+        request: dict, default None
+            Operation of request which generated code, stored in cell metadata
 
         Returns
         -------
         int, index position of code in notebook
 
         """
-        self.notebook["cells"].append(notebook.new_code_cell(code))
+        cell = notebook.new_code_cell(code)
+        if variable:
+            cell["metadata"]["kuma"] = {"variable": variable}
+        if request:
+            cell["metadata"].setdefault("kuma", {})["request"] = request
+        self.notebook["cells"].append(cell)
         return len(self.notebook["cells"]) - 1
 
+    def record_metrics(self, index: int, metrics: Dict[str, Any]):
+        """
+        Stores performance figures of executing a step in metadata of its cell
+
+        Parameters
+        ----------
+        index: int
+            Index position of step
+        metrics: dict
+        """
+        self.notebook["cells"][index]["metadata"].setdefault("kuma", {})["metrics"] = metrics
+
+    def fetch_variables(self, start: int = None, end: int = None) -> List[str]:
+        """
+        Fetches names of variables assigned by a range of steps, steps without
+        variable metadata are skipped.
+
+        Parameters
+        ----------
+        start: int
+        end: int
+
+        Returns
+        -------
+        list of str
+        """
+        cells = self.notebook["cells"][start:end]
+        variables = [cell["metadata"].get("kuma", {}).get("variable") for cell in cells]
+        return [variable for variable in variables if variable]
+
+    def fetch_requests(self, start: int = None, end: int = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetches operations of requests which generated a range of steps
+
+        Parameters
+        ----------
+        start: int
+        end: int
+
+        Returns
+        -------
+        list of dict, None for cells without request metadata
+        """
+        cells = self.notebook["cells"][start:end]
+        return [cell["metadata"].get("kuma", {}).get("request") for cell in cells]
+
+    def __len__(self) -> int:
+        return len(self.notebook["cells"])
+
     def fetch_steps(self, start: int = None, end: int = None) -> str:
         """
         Fetches a range of steps based on start and end index.
@@ -100,3 +209,219 @@ class NotebookStorageBackend(FileStorageBackendInterface):
         if not file_path.endswith(".ipynb"):
             raise TypeError("Incorrect file extension for python notebook")
         write_notebook(self.notebook, file_path)
+
+
+class StepLogStorageBackend(FileStorageBackendInterface):
+    def __init__(self, path: str, recover: bool = True):
+        """
+        Storage backend appending each step as a json line to a log file, every
+        step is flushed and fsync'd before it is executed so that a crash never
+        loses history. An existing log is loaded, i.e. a session can be restored
+        from its log. Notebook is only written on demand by save.
+
+        Workers attached to a session share its log, steps appended by other
+        workers are loaded before steps are read or appended.
+
+        Parameters
+        ----------
+        path: str
+            Path of log file
+        recover: bool, default True
+            Whether or not to repair log left behind by a crash, False if log
+            is shared with a worker which may be appending to it
+        """
+        self.path = path
+        self.steps: List[Dict[str, Any]] = []
+        # bytes of log loaded into steps
+        self._offset = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            self._load(recover=recover)
+        self._log = open(path, "ab")
+        if recover and self._log.tell() and not self._ends_with_newline():
+            # a crash lost newline after last step, next step would be appended to its line
+            self._log.write(b"\n")
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as log:
+            log.seek(-1, os.SEEK_END)
+            return log.read(1) == b"\n"
+
+    def _load(self, recover: bool = False):
+        """
+        Loads entries of log after those already loaded
+
+        Parameters
+        ----------
+        recover: bool, default False
+            Whether or not log is opened after a crash, a torn last step is
+            truncated, otherwise an incomplete line is being written by
+            another worker and is loaded later
+        """
+        valid = self._offset
+        with open(self.path, "rb") as log:
+            log.seek(self._offset)
+            for line in log:
+                if not recover and not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # torn write of last step before a crash
+                    logger.warning(f"Ignoring incomplete steps of {self.path} after byte {valid}")
+                    break
+                valid += len(line)
+                if "code" in entry:
+                    self.steps.append(entry)
+                elif entry.get("step", len(self.steps)) < len(self.steps):
+                    self.steps[entry["step"]]["metrics"] = entry["metrics"]
+        self._offset = valid
+        if recover and valid != os.path.getsize(self.path):
+            os.truncate(self.path, valid)
+
+    def refresh(self):
+        """
+        Loads steps appended to log by other workers
+        """
+        if os.path.getsize(self.path) > self._offset:
+            self._load()
+
+    def step(self, code: str, variable: str = None, request: Dict[str, Any] = None) -> int:
+        """
+        Appends user code to log
+
+        Parameters
+        ----------
+        code: str
+        variable: str, default None
+            Name of variable assigned by code
+        request: dict, default None
+            Operation of request which generated code
+
+        Returns
+        -------
+        int, index position of code in log
+        """
+        step = {
+            "code": code,
+            "variable": variable,
+            "request": request,
+            "time": datetime.utcnow().isoformat(),
+        }
+        self.refresh()
+        self._log.write(orjson.dumps(step) + b"\n")
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        # step is loaded back along with steps other workers appended meanwhile
+        self.refresh()
+        return next(
+            (
+                index
+                for index in range(len(self.steps) - 1, -1, -1)
+                if (self.steps[index]["time"], self.steps[index]["code"]) == (step["time"], code)
+            ),
+            len(self.steps) - 1,
+        )
+
+    def record_metrics(self, index: int, metrics: Dict[str, Any]):
+        """
+        Appends performance figures of executing a step to log, they are not
+        fsync'd as losing them doesn't lose history
+
+        Parameters
+        ----------
+        index: int
+            Index position of step
+        metrics: dict
+        """
+        self._log.write(orjson.dumps({"step": index, "metrics": metrics}) + b"\n")
+        self._log.flush()
+        self.steps[index]["metrics"] = metrics
+
+    def fetch_steps(self, start: int = None, end: int = None) -> str:
+        """
+        Fetches a range of steps based on start and end index.
+
+        Parameters
+        ----------
+        start: int
+        end: int
+
+        Returns
+        -------
+        str
+        """
+        self.refresh()
+        return "\n".join(step["code"] for step in self.steps[start:end])
+
+    def fetch_variables(self, start: int = None, end: int = None) -> List[str]:
+        """
+        Fetches names of variables assigned by a range of steps, steps without
+        variable are skipped.
+
+        Parameters
+        ----------
+        start: int
+        end: int
+
+        Returns
+        -------
+        list of str
+        """
+        self.refresh()
+        return [step["variable"] for step in self.steps[start:end] if step["variable"]]
+
+    def fetch_requests(self, start: int = None, end: int = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetches operations of requests which generated a range of steps
+
+        Parameters
+        ----------
+        start: int
+        end: int
+
+        Returns
+        -------
+        list of dict, None for steps logged without request
+        """
+        self.refresh()
+        return [step.get("request") for step in self.steps[start:end]]
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.steps)
+
+    def save(self, file_path: str):
+        """
+        Compacts log into a notebook, file is replaced atomically. Blocking,
+        run it in a thread from event loop.
+
+        Parameters
+        ----------
+        file_path: Path to file
+        """
+        if not file_path.endswith(".ipynb"):
+            raise TypeError("Incorrect file extension for python notebook")
+        self.refresh()
+        store = NotebookStorageBackend()
+        for step in list(self.steps):
+            index = store.step(step["code"], step["variable"], step.get("request"))
+            if step.get("metrics"):
+                store.record_metrics(index, step["metrics"])
+        write_notebook(store.notebook, f"{file_path}.tmp")
+        os.replace(f"{file_path}.tmp", file_path)
+
+    def close(self, remove: bool = False):
+        """
+        Closes log file
+
+        Parameters
+        ----------
+        remove: bool, default False
+            Whether or not to remove log file
+        """
+        self._log.close()
+        if remove:
+            os.remove(self.path)
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from .executor import JupyterExecutor
+from .main import KumaSession
+
+
+class KernelWatchdog:
+    def __init__(
+        self,
+        executor: JupyterExecutor,
+        session: KumaSession,
+        interval: float = 5,
+        on_recover: Optional[Callable[[], Awaitable]] = None,
+    ):
+        """
+        Periodically checks kernel of a session, a dead kernel (crashed, killed
+        by OOM killer or after ignoring interrupts) is restarted and session
+        state is rebuilt by replaying stored steps from newest checkpoint.
+
+        Parameters
+        ----------
+        executor: JupyterExecutor
+            Executor whose kernel is watched
+        session: KumaSession
+            Session using the kernel, its steps are replayed after restart
+        interval: float, default 5
+            Seconds between two checks
+        on_recover: Callable, default None
+            Coroutine function called after kernel is restarted and state is rebuilt
+        """
+        self.executor = executor
+        self.session = session
+        self.interval = interval
+        self.on_recover = on_recover
+        self.restarts = 0
+        self._task: Optional[asyncio.Future] = None
+
+    def start(self):
+        """
+        Starts watching kernel in background
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        """
+        Stops watching kernel
+        """
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if not await self.executor.is_alive():
+                    await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.opt(exception=True).error("Unable to recover kernel")
+
+    async def recover(self):
+        """
+        Restarts kernel and replays stored steps to rebuild session state
+        """
+        logger.warning("Kernel is dead, restarting it")
+        self.restarts += 1
+        await self.executor.restart()
+        code = self.session.replay_code()
+        if code:
+            await self.executor.execute(code)
+        logger.info("Kernel restarted and session state rebuilt")
+        if self.on_recover:
+            await self.on_recover()
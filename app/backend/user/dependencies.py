@@ -1,3 +1,4 @@
+import time
 from typing import Callable, Optional
 
 from fastapi import Depends, HTTPException, Security
@@ -71,19 +72,29 @@ def _get_authorization_header_optional(
 async def _get_current_user(
     user_ops: UserOps = Depends(), token: str = Depends(_get_authorization_header_retriever()),
 ) -> User:
+    # tokens are cached once verified, until they expire or their user is updated
+    user = user_ops.cache.get(token)
+    if user is not None:
+        return user
+
+    version = user_ops.cache.version
     try:
-        email = jwt.get_email_from_token(token, str(app_config.SECRET_KEY))
+        email, expiry = jwt.get_email_and_expiry_from_token(token, str(app_config.SECRET_KEY))
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=resources.MALFORMED_PAYLOAD,
         )
 
     try:
-        return await user_ops.get_user_by_email(email)
+        user = await user_ops.get_user_by_email(email)
     except EntityDoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=resources.MALFORMED_PAYLOAD,
         )
+    user_ops.cache.put(
+        token, user, tag=user.id_, ttl=expiry.timestamp() - time.time(), version=version
+    )
+    return user
 
 
 async def _get_current_user_optional(
@@ -1,8 +1,10 @@
 import sqlalchemy
 from pydantic import EmailStr, SecretStr
 
+from ..base.cache import TTLCache
 from ..base.errors import EntityDoesNotExist
 from ..base.models import BaseOps
+from ..core.config import app_config
 from ..core.db import metadata
 from .schema import UserInDB
 
@@ -20,6 +22,8 @@ user = sqlalchemy.Table(
 
 class UserOps(BaseOps):
     table = user
+    # authenticated users by token, tagged by their id
+    cache = TTLCache(app_config.USER_CACHE_TTL, app_config.USER_CACHE_MAX_SIZE)
 
     async def get_user_by_email(self, email: EmailStr) -> UserInDB:
         query = self.table.select().where(self.table.c.email == email)
@@ -0,0 +1,266 @@
+"""
+End to end benchmarks of kuma service, run with
+
+    python -m tests.benchmarks.bench_kuma --rows 100000 --save
+    python -m tests.benchmarks.bench_kuma --rows 100000
+
+Benchmarks use tests/testdata/titanic.csv and a synthetic dataset of given
+size. Median of each benchmark is compared with the baseline file, written by
+--save, and the run fails if a benchmark is slower than its baseline by more
+than --tolerance. Baselines depend on the machine, they are only compared
+when dataset size and pandas version are the same.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import orjson
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TITANIC = os.path.join(BENCHMARKS_DIR, os.pardir, "testdata", "titanic.csv")
+BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+WORKDIR = tempfile.mkdtemp(prefix="kuma-bench-")
+
+# configuration is read when app is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORKDIR}/kuma.db")
+os.environ.setdefault("SESSION_IDLE_TTL", "0")
+os.environ.setdefault("KERNEL_POOL_MIN_SIZE", "0")
+
+
+def synthetic_csv(rows: int, columns: int) -> str:
+    """
+    Writes a csv with integer, float and low cardinality string columns
+
+    Parameters
+    ----------
+    rows: int
+    columns: int
+
+    Returns
+    -------
+    str, path of csv
+    """
+    import numpy as np
+    import pandas as pd
+
+    generator = np.random.default_rng(0)
+    data = {}
+    for position in range(columns):
+        kind = position % 3
+        if kind == 0:
+            data[f"int_{position}"] = generator.integers(0, 1000, rows)
+        elif kind == 1:
+            data[f"float_{position}"] = generator.random(rows)
+        else:
+            data[f"str_{position}"] = generator.choice(["red", "green", "blue"], rows)
+    path = os.path.join(WORKDIR, f"synthetic_{rows}x{columns}.csv")
+    pd.DataFrame(data).to_csv(path, index=False)
+    return path
+
+
+def measure(func: Callable[[], Any], repeat: int, number: int = 1) -> List[float]:
+    """
+    Seconds taken by a call of func, each sample is the mean of number calls
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+async def ameasure(func: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_codegen(datasets: Dict[str, str], repeat: int) -> Dict[str, List[float]]:
+    from app.backend.services.kuma.code_generator import PandasCodeGenerator
+
+    requests = {
+        "read_csv": {"mod": "pd", "func": "read_csv", "args": [datasets["titanic"]]},
+        "batch": {
+            "type": "batch",
+            "steps": [
+                {"mod": "pd", "func": "read_csv", "args": [datasets["titanic"]]},
+                {"mod": "df", "func": "dropna"},
+                {"mod": "df", "func": "query", "args": ["Age > 30"]},
+                {"mod": "df", "func": "head", "args": [10]},
+            ],
+        },
+    }
+    results = {}
+    for name, request in requests.items():
+        # first call warms up caches of interpreter
+        PandasCodeGenerator(request, True).process()
+        results[f"codegen.{name}"] = measure(
+            lambda: PandasCodeGenerator(request, True).process(), repeat, number=1000
+        )
+    return results
+
+
+def bench_inspector(repeat: int) -> Dict[str, List[float]]:
+    import pandas as pd
+
+    from app.backend.core.config import app_config
+    from app.backend.services.kuma.inspector import Inspector
+    from app.backend.services.kuma.mapper import TypeMapper
+
+    mapping = TypeMapper(f"{app_config.DATA_DIR}/type_mapping.csv").mapping
+    return {
+        "inspector.pd": measure(lambda: Inspector(pd, mapping).functions, repeat),
+        "inspector.df": measure(lambda: Inspector(pd.DataFrame, mapping).functions, repeat),
+    }
+
+
+async def bench_executor(datasets: Dict[str, str], repeat: int) -> Dict[str, List[float]]:
+    from app.backend.services.kuma.executor import JupyterExecutor
+
+    results = {}
+    executors = []
+
+    async def cold_start():
+        executors.append(await JupyterExecutor.new())
+
+    try:
+        results["executor.cold_start"] = await ameasure(cold_start, repeat)
+        executor = executors[0]
+        results["executor.tiny"] = await ameasure(lambda: executor.execute("1 + 1"), repeat)
+        for name, path in datasets.items():
+            await executor.execute(f'_bench_{name} = pd.read_csv("{path}")')
+            results[f"executor.large.{name}"] = await ameasure(
+                lambda: executor.execute(f'print(_bench_{name}.to_json(orient="split"))'), repeat,
+            )
+    finally:
+        for executor in executors:
+            await executor.shutdown()
+    return results
+
+
+def bench_websocket(datasets: Dict[str, str], repeat: int) -> Dict[str, List[float]]:
+    from sqlalchemy import create_engine
+    from starlette.testclient import TestClient
+
+    from app.backend.core.db import metadata
+    from app.backend.main import app
+
+    metadata.create_all(create_engine(os.environ["DATABASE_URL"]))
+    results = {}
+    with TestClient(app) as client:
+        with client.websocket_connect("/api/pandaui/ws?format=json") as websocket:
+            websocket.receive_json()
+
+            def round_trip(request: Dict[str, Any]):
+                websocket.send_json(request)
+                websocket.receive()
+
+            for name, path in datasets.items():
+                load = {"save": True, "mod": "pd", "func": "read_csv", "args": [path]}
+                describe = {"save": False, "mod": "df", "func": "describe", "checkpoint": False}
+                results[f"websocket.read_csv.{name}"] = measure(lambda: round_trip(load), repeat)
+                # result cache is cleared by each saved step, so describe is never cached
+                results[f"websocket.read_csv_describe.{name}"] = measure(
+                    lambda: (round_trip(load), round_trip(describe)), repeat
+                )
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Names of benchmarks slower than baseline by more than tolerance
+
+    Parameters
+    ----------
+    results: dict
+        Median seconds of each benchmark
+    baseline: dict
+        Contents of baseline file
+    tolerance: float
+        Allowed ratio of slowdown, eg. 0.25 for 25%
+
+    Returns
+    -------
+    list of str
+    """
+    regressions = []
+    for name, seconds in results.items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            print(f"{name:40s} {seconds * 1000:10.3f} ms (no baseline)")
+            continue
+        ratio = seconds / expected
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{name:40s} {seconds * 1000:10.3f} ms {ratio:6.2f}x baseline {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of kuma service")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows of synthetic dataset")
+    parser.add_argument("--columns", type=int, default=12, help="Columns of synthetic dataset")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="Write results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    datasets = {
+        "titanic": os.path.abspath(TITANIC),
+        "synthetic": synthetic_csv(args.rows, args.columns),
+    }
+    samples = {}
+    samples.update(bench_codegen(datasets, args.repeat))
+    samples.update(bench_inspector(args.repeat))
+    samples.update(asyncio.run(bench_executor(datasets, args.repeat)))
+    samples.update(bench_websocket(datasets, args.repeat))
+    results = {name: statistics.median(values) for name, values in samples.items()}
+
+    meta = {
+        "rows": args.rows,
+        "columns": args.columns,
+        "pandas": pd.__version__,
+        "python": platform.python_version(),
+    }
+    if args.save:
+        with open(args.baseline, "wb") as baseline_file:
+            baseline_file.write(
+                orjson.dumps({"meta": meta, "results": results}, option=orjson.OPT_INDENT_2)
+            )
+        for name, seconds in results.items():
+            print(f"{name:40s} {seconds * 1000:10.3f} ms")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        sys.exit(f"Baseline {args.baseline} does not exist, write it with --save")
+    with open(args.baseline, "rb") as baseline_file:
+        baseline = orjson.loads(baseline_file.read())
+    mismatch = {
+        key: value
+        for key, value in baseline["meta"].items()
+        if key != "python" and meta[key] != value
+    }
+    if mismatch:
+        sys.exit(f"Baseline was measured with {mismatch}, run with same options or --save")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        sys.exit(f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of html previews of wide frames, run with
+
+    python -m tests.benchmarks.bench_render --columns 500 --repeat 20
+
+Compares DataFrame.to_html, which was used for previews, with the kuma table
+renderer on a frame of integer, float and string columns. The renderer only
+formats its capped number of columns, 'all columns' renders every column to
+compare formatting alone.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.backend.services.kuma.kernel import render_table
+
+CLASSES = "table is-fullwidth"
+
+
+def wide_frame(rows: int, columns: int) -> pd.DataFrame:
+    generator = np.random.default_rng(0)
+    data = {}
+    for position in range(columns):
+        kind = position % 3
+        if kind == 0:
+            data[f"int_{position}"] = generator.integers(0, 1000, rows)
+        elif kind == 1:
+            data[f"float_{position}"] = generator.random(rows)
+        else:
+            data[f"str_{position}"] = generator.choice(["red", "green", "<blue>"], rows)
+    return pd.DataFrame(data)
+
+
+def measure(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures rendering of html previews")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows of frame")
+    parser.add_argument("--columns", type=int, default=500, help="Columns of frame")
+    parser.add_argument("--display-rows", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    frame = wide_frame(args.rows, args.columns)
+    rows = args.display_rows
+    to_html = measure(
+        lambda: frame.head(rows).to_html(classes=CLASSES, show_dimensions=True), args.repeat
+    )
+    kuma = measure(lambda: render_table(frame, rows, CLASSES), args.repeat)
+    all_columns = measure(
+        lambda: render_table(frame, rows, CLASSES, max_columns=args.columns), args.repeat
+    )
+    to_html_size = len(frame.head(rows).to_html(classes=CLASSES, show_dimensions=True))
+    kuma_size = len(render_table(frame, rows, CLASSES))
+    all_columns_size = len(render_table(frame, rows, CLASSES, max_columns=args.columns))
+    print(f"frame               : {args.rows} rows x {args.columns} columns")
+    print(f"to_html             : {to_html * 1000:8.2f} ms {to_html_size:10d} bytes")
+    print(f"kuma                : {kuma * 1000:8.2f} ms {kuma_size:10d} bytes")
+    print(f"kuma, all columns   : {all_columns * 1000:8.2f} ms {all_columns_size:10d} bytes")
+    print(f"speedup             : {to_html / kuma:8.2f}x")
+    print(f"speedup, all columns: {to_html / all_columns:8.2f}x")
+    if all_columns > to_html:
+        sys.exit("kuma renderer is slower than to_html")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Startup benchmark of the API process, run with
+
+    python -m tests.benchmarks.bench_startup --repeat 5
+
+Each sample imports the FastAPI application in a fresh interpreter. The
+'eager pandas' sample imports pandas first, the way API process did before
+kuma service imports were made lazy.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_APP = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "{prelude}"
+    "import app.backend.main\n"
+    "print(time.perf_counter() - start, 'pandas' in sys.modules)\n"
+)
+
+
+def sample(prelude: str = "") -> tuple:
+    env = {"DATABASE_URL": "sqlite:///data.db", **os.environ}
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_APP.format(prelude=prelude)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout.split()
+    return float(output[0]), output[1] == "True"
+
+
+def measure(prelude: str, repeat: int) -> tuple:
+    samples = [sample(prelude) for _ in range(repeat)]
+    return statistics.median(seconds for seconds, _ in samples), samples[0][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures import time of API application")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    lazy, lazy_pandas = measure("", args.repeat)
+    eager, _ = measure("import pandas\n", args.repeat)
+    print(f"api import          : {lazy * 1000:8.1f} ms (pandas imported: {lazy_pandas})")
+    print(f"api + eager pandas  : {eager * 1000:8.1f} ms")
+    print(f"speedup             : {eager / lazy:8.2f}x")
+    if lazy_pandas:
+        sys.exit("pandas is imported by API process")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Load test of pandaui websocket, run with
+
+    python -m tests.benchmarks.load_pandaui --clients 8 --iterations 2
+
+N clients connect concurrently to /api/pandaui/ws, each with its own session,
+and replay a request script with its think times. A script is a json list of
+{"think": seconds, "request": {...}} or a step log of a recorded session,
+eg. data/sessions/<id>.jsonl, whose think times are the gaps between steps.
+
+A local server is started unless --url is given, so no outside service is
+needed. Latency percentiles are reported for:
+
+- connect: opening websocket until session frame
+- first_result: opening websocket until first request is complete
+- request: sending a request until it is complete, also per function
+
+along with peak number of kernels and resident memory of server and kernels.
+Requests are sent with "stream": true, so that each of them ends with a
+frame tagged by its id.
+"""
+import argparse
+import asyncio
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import orjson
+import websockets
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCRIPT = os.path.join(BENCHMARKS_DIR, "scripts", "titanic.json")
+# frames ending a streamed, previewed or rejected request
+END_FRAMES = ("complete", "ready", "error")
+PERCENTILES = (50, 95, 99)
+
+
+def load_script(path: str, max_think: float) -> List[Dict[str, Any]]:
+    """
+    Loads a request script or requests of a recorded step log
+
+    Parameters
+    ----------
+    path: str
+        .json script or .jsonl step log
+    max_think: float
+        Maximum think time of a recorded step
+
+    Returns
+    -------
+    list of dict with 'think' and 'request' keys
+    """
+    with open(path, "rb") as script_file:
+        content = script_file.read()
+    if not path.endswith(".jsonl"):
+        return orjson.loads(content)
+    script = []
+    previous = None
+    for line in content.splitlines():
+        step = orjson.loads(line)
+        if "code" not in step or not step.get("request"):
+            # metrics of a step or a step which can't be replayed as a request
+            continue
+        recorded = datetime.fromisoformat(step["time"])
+        think = 0.0 if previous is None else (recorded - previous).total_seconds()
+        previous = recorded
+        script.append(
+            {"think": min(think, max_think), "request": {**step["request"], "save": True}}
+        )
+    return script
+
+
+def percentile(values: List[float], rank: int) -> float:
+    """
+    Nearest rank percentile
+
+    Parameters
+    ----------
+    values: list of float
+    rank: int
+        Percentile between 0 and 100
+
+    Returns
+    -------
+    float
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+class Stats:
+    def __init__(self):
+        """
+        Latencies of each phase and failures observed by clients
+        """
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+
+    def observe(self, phase: str, seconds: float):
+        self.latencies.setdefault(phase, []).append(seconds)
+
+    def fail(self, reason: str):
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Count and percentiles in milliseconds of each phase
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            phase: {
+                "count": len(values),
+                **{f"p{rank}": percentile(values, rank) * 1000 for rank in PERCENTILES},
+            }
+            for phase, values in self.latencies.items()
+        }
+
+
+async def run_client(
+    url: str, script: List[Dict[str, Any]], iterations: int, think_scale: float, stats: Stats
+):
+    """
+    Replays script in a new session, iterations are run on the same session
+    """
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(f"{url}/api/pandaui/ws", max_size=None) as websocket:
+            await websocket.recv()
+            stats.observe("connect", time.perf_counter() - started)
+            for iteration in range(iterations):
+                for position, entry in enumerate(script):
+                    await asyncio.sleep(entry.get("think", 0) * think_scale)
+                    request_id = f"{iteration}-{position}"
+                    request = {**entry["request"], "id": request_id, "stream": True}
+                    sent = time.perf_counter()
+                    await websocket.send(orjson.dumps(request).decode())
+                    status = await wait_for_end(websocket, request_id)
+                    completed = time.perf_counter()
+                    if status != "ok":
+                        stats.fail(f"{request.get('func', request.get('type'))}: {status}")
+                    stats.observe("request", completed - sent)
+                    stats.observe(
+                        f"request.{request.get('func', request.get('type'))}", completed - sent
+                    )
+                    if iteration == 0 and position == 0:
+                        stats.observe("first_result", completed - started)
+    except (OSError, websockets.exceptions.WebSocketException) as error:
+        stats.fail(f"connection: {type(error).__name__}")
+
+
+async def wait_for_end(websocket, request_id: str) -> str:
+    """
+    Reads frames until the frame ending request, frames of other requests and
+    binary frames are skipped
+
+    Returns
+    -------
+    str, status of request
+    """
+    while True:
+        frame = await websocket.recv()
+        if isinstance(frame, bytes) or not frame.startswith('{"id"'):
+            continue
+        message = orjson.loads(frame)
+        if message.get("id") == request_id and message.get("type") in END_FRAMES:
+            return message.get("status", "error")
+
+
+def process_memory(pid: int) -> Dict[str, int]:
+    """
+    Number of kernels and total resident memory of a process and its
+    descendants, read from /proc
+
+    Parameters
+    ----------
+    pid: int
+
+    Returns
+    -------
+    dict
+    """
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    # command may contain spaces, fields after it are space separated
+                    parents[int(entry)] = int(stat.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree = {pid}
+    size = 0
+    while len(tree) != size:
+        size = len(tree)
+        tree |= {child for child, parent in parents.items() if parent in tree}
+    kernels = 0
+    rss = 0
+    for process in tree:
+        try:
+            with open(f"/proc/{process}/statm") as statm:
+                rss += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{process}/cmdline", "rb") as cmdline:
+                kernels += b"ipykernel" in cmdline.read()
+        except (OSError, IndexError, ValueError):
+            continue
+    return {"kernels": kernels, "rss": rss}
+
+
+def server_stats(http_url: str) -> Dict[str, int]:
+    """
+    Number of kernels held by server, read from its pool and sessions routes
+    """
+    with urllib.request.urlopen(f"{http_url}/api/pandaui/pool") as response:
+        pool = orjson.loads(response.read())
+    with urllib.request.urlopen(f"{http_url}/api/pandaui/sessions") as response:
+        sessions = orjson.loads(response.read())
+    return {"kernels": pool["idle"] + sessions["owned"], "rss": 0}
+
+
+async def sample(http_url: str, pid: Optional[int], peaks: Dict[str, int], interval: float):
+    loop = asyncio.get_event_loop()
+    while True:
+        if pid is not None:
+            current = process_memory(pid)
+        else:
+            current = await loop.run_in_executor(None, server_stats, http_url)
+        for key, value in current.items():
+            peaks[key] = max(peaks.get(key, 0), value)
+        await asyncio.sleep(interval)
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """
+    Starts API in a subprocess with a temporary database and waits for it
+
+    Parameters
+    ----------
+    port: int
+
+    Returns
+    -------
+    Popen
+    """
+    workdir = tempfile.mkdtemp(prefix="kuma-load-")
+    env = {
+        "DATABASE_URL": f"sqlite:///{workdir}/kuma.db",
+        "SESSION_IDLE_TTL": "0",
+        **os.environ,
+    }
+    create_tables = (
+        "import os\n"
+        "from sqlalchemy import create_engine\n"
+        "from app.backend.core.db import metadata\n"
+        "import app.backend.main\n"
+        "metadata.create_all(create_engine(os.environ['DATABASE_URL']))\n"
+    )
+    subprocess.run([sys.executable, "-c", create_tables], check=True, env=env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.backend.main:app", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit("Server exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/pandaui/pool").close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit("Server did not start within 60 seconds")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(args: argparse.Namespace, http_url: str, pid: Optional[int]) -> Dict[str, Any]:
+    script = load_script(args.script, args.max_think)
+    stats = Stats()
+    peaks: Dict[str, int] = {}
+    sampler = asyncio.ensure_future(sample(http_url, pid, peaks, args.sample_interval))
+    ws_url = http_url.replace("http", "ws", 1)
+    started = time.perf_counter()
+    try:
+        clients = []
+        for _ in range(args.clients):
+            clients.append(run_client(ws_url, script, args.iterations, args.think_scale, stats))
+            await asyncio.sleep(args.ramp_up / args.clients)
+        await asyncio.gather(*clients)
+    finally:
+        sampler.cancel()
+    return {
+        "clients": args.clients,
+        "seconds": time.perf_counter() - started,
+        "phases": stats.report(),
+        "failures": stats.failures,
+        "peak_kernels": peaks.get("kernels", 0),
+        "peak_rss": peaks.get("rss", 0),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{report['clients']} clients in {report['seconds']:.1f} s")
+    header = "".join(f"{f'p{rank} ms':>10s}" for rank in PERCENTILES)
+    print(f"{'phase':32s}{'count':>8s}{header}")
+    for phase, stats in sorted(report["phases"].items()):
+        values = "".join(f"{stats[f'p{rank}']:10.1f}" for rank in PERCENTILES)
+        print(f"{phase:32s}{stats['count']:8d}{values}")
+    print(f"peak kernels: {report['peak_kernels']}")
+    print(f"peak server and kernel rss: {report['peak_rss'] / 1024 ** 2:.1f} MiB")
+    for reason, count in report["failures"].items():
+        print(f"failed {count}x {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of pandaui websocket")
+    parser.add_argument("--clients", type=int, default=4, help="Number of concurrent clients")
+    parser.add_argument("--iterations", type=int, default=1, help="Replays of script per client")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help=".json script or .jsonl step log")
+    parser.add_argument("--think-scale", type=float, default=1.0, help="Multiplier of think times")
+    parser.add_argument("--max-think", type=float, default=5.0, help="Cap of recorded think time")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds to connect all clients")
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--url", help="Url of a running server, eg. http://127.0.0.1:8000")
+    parser.add_argument("--output", help="Writes report as json to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        http_url = args.url.rstrip("/")
+        pid = None
+    else:
+        port = free_port()
+        server = start_server(port)
+        http_url = f"http://127.0.0.1:{port}"
+        pid = server.pid
+    try:
+        report = asyncio.run(run(args, http_url, pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(30)
+    print_report(report)
+    if args.output:
+        with open(args.output, "wb") as output:
+            output.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
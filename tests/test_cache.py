@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+import sqlalchemy
+
+from app.backend.base import cache as cache_module
+from app.backend.base.cache import TTLCache
+from app.backend.base.models import BaseOps
+
+item = sqlalchemy.Table(
+    "item",
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("is_active", sqlalchemy.Boolean),
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+class RecordingOps(BaseOps):
+    table = item
+
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+        self.queries = []
+
+    async def _log_and_execute(self, query, values=None):
+        self.queries.append(query)
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache(ttl=60, max_size=10)
+    cache.put("token", "user")
+    clock.now = 59
+    assert cache.get("token") == "user"
+    clock.now = 60
+    assert cache.get("token") is None
+
+
+def test_entry_expires_with_shorter_ttl(clock):
+    cache = TTLCache(ttl=60, max_size=10)
+    cache.put("token", "user", ttl=5)
+    clock.now = 5
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(ttl=60, max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_disabled_cache_keeps_nothing(clock):
+    cache = TTLCache(ttl=0, max_size=10)
+    cache.put("token", "user")
+    assert cache.get("token") is None
+
+
+def test_value_fetched_before_invalidation_is_not_cached(clock):
+    cache = TTLCache(ttl=60, max_size=10)
+    version = cache.version
+    cache.invalidate(1)
+    cache.put("token", "stale user", tag=1, version=version)
+    assert cache.get("token") is None
+
+
+def test_delete_invalidates_entries_of_row(clock):
+    ops = RecordingOps(TTLCache(ttl=60, max_size=10))
+    ops.cache.put("token-1", "user 1", tag=1)
+    ops.cache.put("token-2", "user 2", tag=2)
+
+    asyncio.run(ops.delete(id=1))
+
+    assert len(ops.queries) == 1
+    assert ops.cache.get("token-1") is None
+    assert ops.cache.get("token-2") == "user 2"
+
+
+def test_update_invalidates_all_entries(clock):
+    ops = RecordingOps(TTLCache(ttl=60, max_size=10))
+    ops.cache.put("token-1", "user 1", tag=1)
+    ops.cache.put("token-2", "user 2", tag=2)
+
+    asyncio.run(ops.update({"is_active": False}, {"id": 1}))
+
+    assert str(ops.queries[0]) == "UPDATE item SET is_active=:is_active WHERE item.id = :id_1"
+    assert ops.cache.get("token-1") is None
+    assert ops.cache.get("token-2") is None
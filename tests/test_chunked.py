@@ -0,0 +1,117 @@
+import pandas as pd
+import pytest
+
+from app.backend.services.kuma import kernel
+from app.backend.services.kuma.code_generator import PandasCodeGenerator
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame(
+        {"key": ["a", "b", "a", "b", "a"], "x": [1, 2, 3, 4, 5], "y": [1.0, 2.0, 3.0, 4.0, 5.0]}
+    ).to_csv(path, index=False)
+    return str(path)
+
+
+def chunked(csv_path, *steps, **options):
+    request = {
+        "type": "batch",
+        "chunked": True,
+        "chunksize": 2,
+        "steps": [{"mod": "pd", "func": "read_csv", "args": [csv_path]}, *steps],
+        **options,
+    }
+    return PandasCodeGenerator(request, save=True)
+
+
+def run(code_gen):
+    namespace = {"pd": pd, "_kuma": kernel}
+    exec(code_gen.user_code(), namespace)  # noqa: S102
+    return namespace["df"]
+
+
+@pytest.mark.parametrize(
+    "agg", [{"mod": "df", "func": "agg", "args": []}, {"mod": "df", "func": "agg"}]
+)
+def test_agg_without_func_is_rejected(csv_path, agg):
+    with pytest.raises(ValueError, match="'agg' supports a single func"):
+        chunked(csv_path, agg).user_code()
+
+
+def test_agg_with_func_keyword(csv_path):
+    result = run(
+        chunked(
+            csv_path,
+            {"mod": "df", "func": "filter", "kwargs": {"items": ["y"]}},
+            {"mod": "df", "func": "agg", "kwargs": {"func": "max"}},
+        )
+    )
+    expected = pd.read_csv(csv_path)[["y"]].max()
+    pd.testing.assert_series_equal(result, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("reduction", ["sum", "count", "min", "max", "mean"])
+def test_grouped_reduction_matches_whole_data(csv_path, reduction):
+    result = run(
+        chunked(
+            csv_path,
+            {"mod": "df", "func": "groupby", "args": ["key"]},
+            {"mod": "df", "func": reduction},
+        )
+    )
+    expected = getattr(pd.read_csv(csv_path).groupby("key"), reduction)()
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_combine_partials_of_mean():
+    partials = [
+        (pd.Series({"x": 3.0}), pd.Series({"x": 2})),
+        (pd.Series({"x": 3.0}), pd.Series({"x": 1})),
+    ]
+    pd.testing.assert_series_equal(kernel.combine_partials(partials, "mean"), pd.Series({"x": 2.0}))
+
+
+def test_combine_partials_without_chunks():
+    assert kernel.combine_partials([], "sum").empty
+    assert kernel.combine_partials([], "sum", grouped=True).empty
+
+
+def test_parquet_sink_writes_file_once_closed(csv_path, tmp_path):
+    pytest.importorskip("pyarrow")
+    output = str(tmp_path / "out" / "data.parquet")
+    sink = kernel.ParquetSink(output)
+    for chunk in pd.read_csv(csv_path, chunksize=2):
+        sink.write(chunk)
+        assert not (tmp_path / "out" / "data.parquet").exists()
+    summary = sink.close()
+
+    assert summary.to_dict("records") == [{"path": output, "rows": 5, "columns": 3}]
+    pd.testing.assert_frame_equal(pd.read_parquet(output), pd.read_csv(csv_path))
+
+
+@pytest.mark.parametrize(
+    "drop",
+    [
+        {"mod": "df", "func": "drop", "args": [[0]]},
+        {"mod": "df", "func": "drop", "kwargs": {"index": [0]}},
+        {"mod": "df", "func": "drop", "args": [[0]], "kwargs": {"axis": 0}},
+    ],
+)
+def test_drop_of_rows_is_rejected(csv_path, drop):
+    with pytest.raises(ValueError, match="'drop' only drops columns"):
+        chunked(csv_path, drop).user_code()
+
+
+@pytest.mark.parametrize(
+    "drop",
+    [
+        {"mod": "df", "func": "drop", "kwargs": {"columns": ["x"]}},
+        {"mod": "df", "func": "drop", "args": [["x"]], "kwargs": {"axis": 1}},
+    ],
+)
+def test_drop_of_columns(csv_path, drop, tmp_path):
+    pytest.importorskip("pyarrow")
+    output = str(tmp_path / "out.parquet")
+    run(chunked(csv_path, drop, output=output))
+    pd.testing.assert_frame_equal(pd.read_parquet(output), pd.read_csv(csv_path).drop(columns="x"))
@@ -0,0 +1,186 @@
+import asyncio
+
+import orjson
+
+from app.backend.core.config import app_config
+from app.backend.services.kuma.code_generator import JSON_MIME_TYPE, TIMINGS_MIME_TYPE
+from app.backend.services.kuma.executor import JupyterExecutor
+from app.backend.services.kuma.main import KumaSession
+from app.backend.services.kuma.watchdog import KernelWatchdog
+
+
+def run_with_kernel(scenario):
+    async def main():
+        executor = await JupyterExecutor.new()
+        try:
+            return await scenario(executor)
+        finally:
+            await executor.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_cancel_of_queued_execution_does_not_interrupt_next():
+    async def scenario(executor):
+        running = executor.submit("import time\ntime.sleep(0.5)\n'first'")
+        queued = executor.submit("queued = True")
+        following = executor.submit("time.sleep(0.5)\n'third'")
+        await executor.cancel(queued)
+        results = [await executor.wait(execution) for execution in (running, queued, following)]
+        results.append(await executor.execute("'queued' in dir()"))
+        return results, [execution.status for execution in (running, queued, following)]
+
+    results, statuses = run_with_kernel(scenario)
+    assert statuses == ["ok", "cancelled", "ok"]
+    # cancelled execution never reached kernel
+    assert results[3] == "False"
+    assert results[0] == "'first'"
+    assert results[2] == "'third'"
+
+
+def test_cancel_of_running_execution_interrupts_it():
+    async def scenario(executor):
+        running = executor.submit("import time\ntime.sleep(30)")
+        following = executor.submit("'next'")
+        while not running.started:
+            await asyncio.sleep(0.05)
+        await executor.cancel(running)
+        await executor.wait(running)
+        return running, await executor.wait(following), following.status
+
+    running, result, status = run_with_kernel(scenario)
+    assert running.status == "cancelled"
+    assert running.error["ename"] == "KeyboardInterrupt"
+    assert (result, status) == ("'next'", "ok")
+
+
+def test_call_returns_value_of_attribute_and_error_of_operation():
+    async def scenario(executor):
+        await executor.execute("df = pd.DataFrame({'a': [1, 2]})")
+        shape = executor.call({"mod": "df", "func": "shape", "variable": "shape"})
+        failed = executor.call(
+            {"mod": "df", "func": "drop", "args": [["missing"]], "variable": "dropped"}
+        )
+        return await executor.wait(shape), shape.status, await executor.wait(failed), failed
+
+    shape, status, result, failed = run_with_kernel(scenario)
+    assert (shape, status) == ("(2, 1)", "ok")
+    assert (result, failed.status, failed.error["ename"]) == ({}, "error", "KeyError")
+    assert "missing" in failed.error["evalue"]
+
+
+def test_replies_are_routed_to_their_execution():
+    async def scenario(executor):
+        executions = [
+            executor.submit("import time\ntime.sleep(0.2)\n'slow'"),
+            executor.submit("print('printed')"),
+            executor.submit("1 / 0"),
+            executor.submit("'fast'"),
+        ]
+        results = await asyncio.gather(*(executor.wait(execution) for execution in executions))
+        return results, [execution.status for execution in executions], executions[2].error
+
+    results, statuses, error = run_with_kernel(scenario)
+    assert results == ["'slow'", "printed\n", {}, "'fast'"]
+    assert statuses == ["ok", "ok", "error", "ok"]
+    assert error["ename"] == "ZeroDivisionError"
+
+
+def test_stream_yields_outputs_while_running():
+    async def scenario(executor):
+        execution = executor.submit(
+            "import time\nfor i in range(3):\n\tprint(i, flush=True)\n\ttime.sleep(0.3)",
+            stream=True,
+        )
+        outputs = []
+        async for output in executor.stream(execution):
+            outputs.append((output, execution.future.done()))
+        return outputs, execution.status
+
+    outputs, status = run_with_kernel(scenario)
+    assert [output for output, _ in outputs] == [
+        {"type": "stream", "data": f"{i}\n"} for i in range(3)
+    ]
+    # outputs arrived before execution finished
+    assert not any(done for _, done in outputs)
+    assert status == "ok"
+
+
+def test_view_pages_through_result_without_executing_operation(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_config, "DATA_DIR", str(tmp_path))
+    session = KumaSession()
+
+    async def scenario(executor):
+        await executor.execute(
+            session.code(
+                {"mod": "pd", "func": "DataFrame", "kwargs": {"data": {"a": list(range(20))}}},
+                save=True,
+            )
+        )
+        await executor.execute("df['b'] = df['a'] * 2")
+        view = session.view(
+            {"variable": "df", "offset": 10, "columns": ["b"]}, display_rows=3, output_format="json"
+        )
+        return await executor.wait(executor.submit(view))
+
+    result = orjson.loads(run_with_kernel(scenario)[JSON_MIME_TYPE])
+    assert result["shape"] == [3, 1]
+    assert (result["index"], result["data"]) == ([10, 11, 12], [[20, 22, 24]])
+
+
+def test_execution_past_timeout_is_interrupted():
+    async def scenario(executor):
+        execution = executor.submit("import time\ntime.sleep(30)")
+        await executor.wait(execution, timeout=0.5)
+        return execution, await executor.execute("'alive'")
+
+    execution, result = run_with_kernel(scenario)
+    assert (execution.status, execution.error["ename"]) == ("timeout", "KeyboardInterrupt")
+    assert result == "'alive'"
+
+
+def test_watchdog_restarts_dead_kernel_and_replays_steps(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_config, "DATA_DIR", str(tmp_path))
+    session = KumaSession()
+
+    async def scenario(executor):
+        request = {"mod": "pd", "func": "DataFrame", "kwargs": {"data": {"a": [1, 2]}}}
+        await executor.execute(session.code(request, save=True))
+        recovered = asyncio.Event()
+
+        async def on_recover():
+            recovered.set()
+
+        watchdog = KernelWatchdog(executor, session, interval=0.1, on_recover=on_recover)
+        watchdog.start()
+        await executor.kill()
+        await recovered.wait()
+        await watchdog.stop()
+        return watchdog.restarts, await executor.execute("df.shape")
+
+    assert run_with_kernel(scenario) == (1, "(2, 1)")
+
+
+def test_batch_runs_in_one_execution_with_timings_of_steps(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_config, "DATA_DIR", str(tmp_path))
+    session = KumaSession()
+    request = {
+        "type": "batch",
+        "steps": [
+            {"mod": "pd", "func": "DataFrame", "kwargs": {"data": {"a": [3, 1, 2]}}},
+            {"mod": "df", "func": "sort_values", "args": ["a"]},
+            {"mod": "df", "func": "head", "args": [2]},
+        ],
+    }
+
+    async def scenario(executor):
+        execution = executor.submit(session.code(request, save=True, output_format="json"))
+        result = await executor.wait(execution)
+        return result, execution, await executor.execute("df['a'].tolist()")
+
+    result, execution, values = run_with_kernel(scenario)
+    assert execution.status == "ok"
+    assert orjson.loads(result[JSON_MIME_TYPE])["data"] == [[1, 2]]
+    assert len(orjson.loads(execution.displays[TIMINGS_MIME_TYPE])) == 3
+    assert values == "[1, 2]"
+    assert len(session.store) == 3
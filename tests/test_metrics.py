@@ -0,0 +1,65 @@
+import asyncio
+import re
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from app.backend.core.metrics import phase_seconds, requests_total, router
+
+SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$")
+# suffixes of samples of each type of metric in text format 0.0.4
+SUFFIXES = {"counter": ("",), "histogram": ("_bucket", "_sum", "_count")}
+
+
+def parse(text):
+    """
+    Parses text exposition format, returns type of each metric and samples
+    grouped by metric they belong to
+    """
+    types = {}
+    helps = set()
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            helps.add(line.split(" ")[2])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+        else:
+            name, _, value = SAMPLE.match(line).groups()
+            float(value)
+            family = next(
+                family
+                for family, kind in types.items()
+                for suffix in SUFFIXES[kind]
+                if name == f"{family}{suffix}"
+            )
+            samples.setdefault(family, []).append(line)
+    assert helps == set(types)
+    return types, samples
+
+
+def test_metrics_follow_text_format():
+    app = FastAPI()
+    app.include_router(router)
+    requests_total.inc(type="function", status="ok")
+    phase_seconds.observe(0.2, phase="execute")
+    # loop TestClient would create is never closed
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        response = TestClient(app).get("/metrics")
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    types, samples = parse(response.text)
+    assert types["kuma_requests_total"] == "counter"
+    assert 'kuma_requests_total{type="function",status="ok"} 1.0' in samples["kuma_requests_total"]
+    assert types["kuma_request_phase_seconds"] == "histogram"
+    assert (
+        'kuma_request_phase_seconds_count{phase="execute"} 1'
+        in samples["kuma_request_phase_seconds"]
+    )
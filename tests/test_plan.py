@@ -0,0 +1,112 @@
+import pandas as pd
+import pytest
+
+from app.backend.services.kuma.code_generator import PandasCodeGenerator
+from app.backend.services.kuma.plan import LogicalPlan
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b,c\n1,x,1.5\n2,y,2.5\n3,z,3.5\n")
+    return str(path)
+
+
+def run(requests):
+    namespace = {"pd": pd}
+    code = "\n".join(PandasCodeGenerator(request, save=True).user_code() for request in requests)
+    exec(code, namespace)  # noqa: S102
+    return namespace["df"]
+
+
+def test_filter_with_missing_column_is_pushed_without_changing_result(csv_path):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path]},
+        {"mod": "df", "func": "filter", "kwargs": {"items": ["c", "missing", "a"]}},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert optimized[0]["kwargs"]["usecols"] == ["c", "missing", "a"]
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
+    assert list(run(optimized).columns) == ["c", "a"]
+
+
+def test_filter_is_not_pushed_into_list_of_usecols(csv_path):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path], "kwargs": {"usecols": ["a", "b"]}},
+        {"mod": "df", "func": "filter", "kwargs": {"items": ["a"]}},
+    ]
+    assert LogicalPlan(requests).optimize()[0]["kwargs"]["usecols"] == ["a", "b"]
+
+
+def test_astype_is_pushed_as_dtype(csv_path):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path]},
+        {"mod": "df", "func": "astype", "args": [{"a": "float64"}]},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert optimized[0]["kwargs"]["dtype"] == {"a": "float64"}
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
+
+
+def test_astype_with_errors_is_not_pushed(csv_path):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path]},
+        {"mod": "df", "func": "astype", "args": [{"b": "float64"}], "kwargs": {"errors": "ignore"}},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert "dtype" not in optimized[0].get("kwargs", {})
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
+
+
+def test_head_is_pushed_as_nrows(csv_path):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path], "kwargs": {"nrows": 2}},
+        {"mod": "df", "func": "head", "args": [1]},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert optimized[0]["kwargs"]["nrows"] == 1
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"parse_dates": ["b"]},
+        {"parse_dates": {"date": ["b"]}},
+        {"dtype": {"b": "string"}},
+        {"index_col": "b"},
+    ],
+)
+def test_filter_keeps_columns_named_by_scan(csv_path, kwargs):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path], "kwargs": kwargs},
+        {"mod": "df", "func": "filter", "kwargs": {"items": ["a"]}},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert "usecols" in optimized[0]["kwargs"]
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
+
+
+def test_filter_is_not_pushed_with_positional_columns(csv_path):
+    requests = [
+        {"mod": "pd", "func": "read_csv", "args": [csv_path], "kwargs": {"parse_dates": [1]}},
+        {"mod": "df", "func": "filter", "kwargs": {"items": ["a"]}},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert "usecols" not in optimized[0]["kwargs"]
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
+
+
+def test_head_is_not_pushed_with_skipfooter(csv_path):
+    requests = [
+        {
+            "mod": "pd",
+            "func": "read_csv",
+            "args": [csv_path],
+            "kwargs": {"skipfooter": 1, "engine": "python"},
+        },
+        {"mod": "df", "func": "head", "args": [1]},
+    ]
+    optimized = LogicalPlan(requests).optimize()
+    assert "nrows" not in optimized[0]["kwargs"]
+    pd.testing.assert_frame_equal(run(optimized), run(requests))
@@ -0,0 +1,39 @@
+import asyncio
+
+from app.backend.services.kuma.pool import KernelPool
+
+
+def test_released_kernel_is_reset_and_reused():
+    async def scenario():
+        pool = KernelPool(0, 1)
+        executor = await pool.acquire()
+        await executor.execute("x = 1")
+        await pool.release(executor)
+        reused = await pool.acquire()
+        names = await reused.execute("'x' in dir(), 'pd' in dir(), '_kuma' in dir()")
+        await pool.release(reused)
+        await pool.close()
+        return executor, reused, names, pool.stats
+
+    executor, reused, names, stats = asyncio.run(scenario())
+    assert reused is executor
+    assert names == "(False, True, True)"
+    assert (stats["hits"], stats["misses"], stats["retired"]) == (1, 1, 1)
+
+
+def test_kernel_ignoring_interrupt_is_retired_on_release():
+    async def scenario():
+        pool = KernelPool(0, 1, reset_timeout=1)
+        executor = await pool.acquire()
+        running = executor.submit(
+            "import time\nwhile True:\n\ttry:\n\t\ttime.sleep(1)\n\texcept KeyboardInterrupt:\n\t\tpass"
+        )
+        while not running.started:
+            await asyncio.sleep(0.05)
+        await pool.release(executor)
+        stats = pool.stats
+        await pool.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats["idle"], stats["retired"]) == (0, 1)
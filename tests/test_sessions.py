@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.backend.base.errors import EntityDoesNotExist
+from app.backend.core.config import app_config
+from app.backend.pandaui import sessions
+from app.backend.pandaui.sessions import SessionManager
+from app.backend.services.kuma.pool import KernelPool
+
+
+class Registry:
+    def __init__(self):
+        self.sessions = {}
+
+    async def get_session(self, session_id):
+        if session_id not in self.sessions:
+            raise EntityDoesNotExist(f"Session with id:{session_id} not found!")
+        return self.sessions[session_id]
+
+    async def register(self, session_id, worker, connection_info):
+        self.sessions[session_id] = SimpleNamespace(
+            worker=worker, connection_info=connection_info, last_activity=datetime.utcnow()
+        )
+
+    async def touch(self, session_id):
+        pass
+
+    async def delete(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    async def delete_worker_sessions(self, worker):
+        self.sessions = {
+            session_id: session
+            for session_id, session in self.sessions.items()
+            if session.worker != worker
+        }
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_config, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(sessions, "kernel_pool", KernelPool(0, 1))
+    manager = SessionManager(worker="worker", idle_ttl=60)
+    manager.registry = Registry()
+    return manager
+
+
+def test_session_reopened_while_closing_waits_for_teardown(manager):
+    async def scenario():
+        entry, _ = await manager.open("session", "first websocket")
+        await manager.disconnect(entry, "first websocket")
+        closing = asyncio.ensure_future(manager._close_idle(entry))
+        await asyncio.sleep(0)
+        reopened, resumed = await manager.open("session", "second websocket")
+        closed = await closing
+        registered = "session" in manager.registry.sessions
+        await manager.close_all()
+        await sessions.kernel_pool.close()
+        return entry, reopened, resumed, closed, registered
+
+    entry, reopened, resumed, closed, registered = asyncio.run(scenario())
+    assert closed and reopened is not entry and not resumed
+    # teardown of closed session did not unregister the new one
+    assert registered
+    assert manager._locks == {}
+
+
+def test_session_of_another_worker_is_attached_to(manager):
+    other = SessionManager(worker="other worker", idle_ttl=60)
+    other.registry = manager.registry
+
+    async def scenario():
+        owned, _ = await manager.open("session", "first websocket")
+        await owned.executor.execute(
+            owned.session.code(
+                {"mod": "pd", "func": "DataFrame", "kwargs": {"data": {"a": [1, 2]}}}, save=True
+            )
+        )
+        attached, resumed = await other.open("session", "second websocket")
+        code = attached.session.code({"mod": "df", "func": "head", "args": [1]}, save=True)
+        await attached.executor.execute(code)
+        shape = await owned.executor.execute("df.shape")
+        await other.disconnect(attached, "second websocket")
+        steps = owned.session.store.fetch_steps()
+        await manager.close_all()
+        await sessions.kernel_pool.close()
+        return attached, resumed, shape, steps
+
+    attached, resumed, shape, steps = asyncio.run(scenario())
+    assert not attached.owner and resumed
+    # step run through attached worker changed state of owner's kernel and log
+    assert shape == "(1, 1)"
+    assert steps.splitlines()[-1] == "df = df.head(1)"
+    assert other._entries == {}
+
+
+def test_idle_session_is_resumed_until_evicted(manager):
+    manager.memory_limit = 1
+
+    async def scenario():
+        entry, _ = await manager.open("session", "first websocket")
+        await entry.executor.execute("x = 1")
+        await manager.disconnect(entry, "first websocket")
+        resumed_entry, resumed = await manager.open("session", "second websocket")
+        kept = await resumed_entry.executor.execute("x")
+        await manager.disconnect(resumed_entry, "second websocket")
+        await manager.evict()
+        stats = manager.stats
+        await sessions.kernel_pool.close()
+        return entry, resumed_entry, resumed, kept, stats
+
+    entry, resumed_entry, resumed, kept, stats = asyncio.run(scenario())
+    assert resumed_entry is entry and resumed and kept == "1"
+    assert (stats["open"], stats["evicted"]) == (0, 1)
+    assert "session" not in manager.registry.sessions
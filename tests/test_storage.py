@@ -0,0 +1,73 @@
+import orjson
+
+from app.backend.core.config import app_config
+from app.backend.services.kuma.main import KumaSession
+from app.backend.services.kuma.storage import StepLogStorageBackend
+
+
+def test_step_is_appended_after_step_which_lost_its_newline(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    store = StepLogStorageBackend(path)
+    store.step("df = pd.read_csv('data.csv')", "df", {"mod": "pd", "func": "read_csv"})
+    store.close()
+    with open(path, "rb+") as log:
+        log.truncate(len(log.read()) - 1)
+
+    store = StepLogStorageBackend(path)
+    store.step("df = df.head()", "df", {"mod": "df", "func": "head"})
+    store.close()
+
+    restored = StepLogStorageBackend(path)
+    assert restored.fetch_steps() == "df = pd.read_csv('data.csv')\ndf = df.head()"
+    with open(path, "rb") as log:
+        assert [orjson.loads(line)["variable"] for line in log] == ["df", "df"]
+    restored.close()
+
+
+def test_torn_step_is_truncated(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    store = StepLogStorageBackend(path)
+    store.step("df = pd.read_csv('data.csv')", "df")
+    store.close()
+    with open(path, "ab") as log:
+        log.write(b'{"code": "df = df.he')
+
+    store = StepLogStorageBackend(path)
+    store.step("df = df.head()", "df")
+    store.close()
+
+    restored = StepLogStorageBackend(path)
+    assert len(restored) == 2
+    restored.close()
+
+
+def test_steps_appended_by_attached_worker_are_loaded_by_owner(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    owner = StepLogStorageBackend(path)
+    owner.step("df = pd.read_csv('data.csv')", "df")
+    attached = StepLogStorageBackend(path, recover=False)
+
+    assert attached.step("df = df.head()", "df") == 1
+    attached.record_metrics(1, {"phases": {"execute": 0.1}})
+    assert owner.step("df = df.dropna()", "df") == 2
+
+    assert len(owner) == len(attached) == 3
+    assert owner.fetch_steps() == attached.fetch_steps()
+    assert owner.steps[1]["metrics"] == {"phases": {"execute": 0.1}}
+    owner.close()
+    attached.close()
+
+
+def test_saved_step_of_session_is_step_it_appended(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_config, "DATA_DIR", str(tmp_path))
+    owner = KumaSession("session")
+    attached = KumaSession("session", attached=True)
+
+    owner.code({"mod": "pd", "func": "read_csv", "args": ["data.csv"]}, save=True)
+    attached.code({"mod": "df", "func": "head"}, save=True)
+    owner.code({"mod": "df", "func": "dropna"}, save=True)
+
+    assert (owner.last_step, attached.last_step) == (2, 1)
+    assert owner.store.steps[attached.last_step]["code"] == "df = df.head()"
+    owner.store.close()
+    attached.store.close()